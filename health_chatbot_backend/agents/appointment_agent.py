@@ -2,22 +2,19 @@ import logging
 import re
 from typing import List, Dict, Any
 import json
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, PromptTemplate
-from langchain.chains import LLMChain
 from fastapi import HTTPException
 
-# Import llm from settings
-from config.settings import llm, logger
+# Import logger from settings and the shared LLM runner
+from config.settings import logger
+from utils.llm_utils import run_chain
 # Import utilities
 from utils.conversation_utils import update_flow_marker, get_current_flow
+from utils.context_builder import build_prompt_context
+from utils.conversation_state import get_tracked_state, append_message
 # Import database service functions
-from services.database_service import location_based_doctor_search, get_doctor_by_id, get_doctor_available_slots, store_appointment_in_database
+from services.database_service import location_based_doctor_search, get_doctor_by_id, get_doctor_available_slots, get_next_free_slots, store_appointment_in_database
 from models.request_models import ChatRequest,HistoryRequest
-# Agentic System Prompts for Appointment Flow
-from models.prompts import (
-    LOCATION_COLLECTION_PROMPT, ENHANCED_DOCTOR_DISPLAY_PROMPT,DEPARTMENT_PROMPT ,DOCTOR_SELECTION_PROMPT,SLOT_AVAILABILITY_PROMPT,SLOT_SELECTION_PROMPT,
-    BOOKING_CONFIRMATION_PROMPT, FINAL_BOOKING_CONFIRMATION_PROMPT
-)
+# Appointment prompts are compiled once in utils/chain_registry.py
 
 def extract_user_preferences(user_input: str) -> dict:
     """Extract city, department, or doctor name from user input"""
@@ -72,6 +69,10 @@ def get_appointment_state(conversation_history: List[Dict[str, str]]) -> dict:
     """Extract appointment booking state from conversation history"""
     print("Function: get_appointment_state")
     
+    tracked = get_tracked_state(conversation_history)
+    if tracked is not None:
+        return tracked.appointment_state()
+    
     state = {
         "city": None,
         "department": None,
@@ -155,33 +156,30 @@ async def collect_location_info(request: ChatRequest):
         preference_status = "✅ Collected" if (state["department"] or state["doctor_name"]) else "❌ Missing"
         
         # Generate appropriate response
-        conv_history = "\n".join(
-            f"{msg['role'].upper()}: {msg['content']}"
-            for msg in request.conversation_history if msg['role'] != "system"
+        conv_history = build_prompt_context(request.conversation_history, request.chat_history_id)
+        
+        response = await run_chain(
+            "location_collection",
+            stream=True,
+            conversation_history=conv_history,
+            user_input=request.user_input,
+            language=request.language,
+            city_status=city_status,
+            preference_status=preference_status
         )
         
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(
-                LOCATION_COLLECTION_PROMPT.format(
-                    conversation_history=conv_history,
-                    user_input=request.user_input,
-                    language=request.language,
-                    city_status=city_status,
-                    preference_status=preference_status
-                )
-            ),
-            HumanMessagePromptTemplate.from_template("{user_input}"),
-        ])
-        
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = await chain.arun(user_input=request.user_input)
-        
         return {"response": response.strip()}
         
     except Exception as e:
         logger.error(f"Location collection error: {str(e)}")
         raise HTTPException(500, "Location collection failed")
 
+def format_next_available(next_slot: dict) -> str:
+    """Extra listing line with a doctor's earliest free slot"""
+    if not next_slot:
+        return ""
+    return f"\n   ⏭️ Next available: {next_slot['day_name']}, {next_slot['formatted_date']} at {next_slot['time']}"
+
 async def search_and_display_doctors(request: ChatRequest):
     """Search doctors based on collected criteria and display results"""
     print("Function: search_and_display_doctors")
@@ -217,28 +215,26 @@ async def search_and_display_doctors(request: ChatRequest):
         
         # Format doctors info for LLM
         if doctors_list:
+            # Earliest availability for every listed doctor in one batch query
+            next_slots = await get_next_free_slots([doc['id'] for doc in doctors_list])
             doctors_text = f"FOUND {len(doctors_list)} DOCTORS:\n" + "\n".join([
                 f"🏥 Dr. {doc['name']} - {doc['department']}\n   📍 {doc['Location']}\n   🕒 {doc.get('timings', 'Contact for timings')}"
+                + format_next_available(next_slots.get(doc['id']))
                 for doc in doctors_list
             ])
         else:
             doctors_text = "No doctors found matching the criteria."
         
         # Generate response
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(
-                ENHANCED_DOCTOR_DISPLAY_PROMPT.format(
-                    search_criteria=search_criteria_text,
-                    city=state["city"] or "your location",
-                    doctors_info=doctors_text,
-                    language=request.language
-                )
-            ),
-            HumanMessagePromptTemplate.from_template("{user_input}"),
-        ])
-        
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = await chain.arun(user_input=request.user_input)
+        response = await run_chain(
+            "doctor_display",
+            stream=True,
+            search_criteria=search_criteria_text,
+            city=state["city"] or "your location",
+            doctors_info=doctors_text,
+            language=request.language,
+            user_input=request.user_input
+        )
         
         return {"response": response.strip()}
         
@@ -280,6 +276,10 @@ def get_selected_doctor_from_history(conversation_history: List[Dict[str, str]])
     """Extract selected doctor ID from conversation history"""
     print("Function: get_selected_doctor_from_history")
     
+    tracked = get_tracked_state(conversation_history)
+    if tracked is not None:
+        return tracked.selected_doctor_id
+    
     for msg in reversed(conversation_history):
         if msg["role"] == "system" and "selected_doctor_id" in msg.get("content", ""):
             try:
@@ -326,7 +326,7 @@ async def handle_doctor_selection(request: ChatRequest, doctors_list: list):
         
         if selected_doctor_id:
             # Doctor selected - add to conversation history and move to slot selection
-            request.conversation_history.append({
+            append_message(request.conversation_history, {
                 "role": "system",
                 "content": f"selected_doctor_id: {selected_doctor_id}"
             })
@@ -344,19 +344,13 @@ async def handle_doctor_selection(request: ChatRequest, doctors_list: list):
                 for doc in doctors_list
             ])
             
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(
-                    DOCTOR_SELECTION_PROMPT.format(
-                        user_input=request.user_input,
-                        language=request.language,
-                        doctors_info=doctors_info
-                    )
-                ),
-                HumanMessagePromptTemplate.from_template("{user_input}"),
-            ])
-            
-            chain = LLMChain(llm=llm, prompt=prompt)
-            response = await chain.arun(user_input=request.user_input)
+            response = await run_chain(
+                "doctor_selection",
+                stream=True,
+                user_input=request.user_input,
+                language=request.language,
+                doctors_info=doctors_info
+            )
             
             return {"response": response.strip()}
             
@@ -382,7 +376,7 @@ async def handle_slot_selection_with_confirmation(request: ChatRequest, doctor:
         
         if selected_slot:
             # User selected a slot - save to conversation history and show confirmation
-            request.conversation_history.append({
+            append_message(request.conversation_history, {
                 "role": "system",
                 "content": f"selected_slot: {json.dumps(selected_slot)}"
             })
@@ -399,27 +393,18 @@ async def handle_slot_selection_with_confirmation(request: ChatRequest, doctor:
                     slots_text += f"   🕒 {slot['time']} - {slot['end_time']}\n"
             
             # Generate response asking for slot selection
-            conv_history = "\n".join(
-                f"{msg['role'].upper()}: {msg['content']}"
-                for msg in request.conversation_history if msg['role'] != "system"
-            )
+            conv_history = build_prompt_context(request.conversation_history, request.chat_history_id)
             
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(
-                    SLOT_SELECTION_PROMPT.format(
-                        doctor_name=doctor['name'],
-                        doctor_department=doctor['department'],
-                        user_input=request.user_input,
-                        language=request.language,
-                        available_slots=slots_text,
-                        conversation_history=conv_history
-                    )
-                ),
-                HumanMessagePromptTemplate.from_template("{user_input}"),
-            ])
-            
-            chain = LLMChain(llm=llm, prompt=prompt)
-            response = await chain.arun(user_input=request.user_input)
+            response = await run_chain(
+                "slot_selection",
+                stream=True,
+                doctor_name=doctor['name'],
+                doctor_department=doctor['department'],
+                user_input=request.user_input,
+                language=request.language,
+                available_slots=slots_text,
+                conversation_history=conv_history
+            )
             
             return {"response": response.strip()}
         
@@ -521,12 +506,7 @@ async def suggest_department(request: HistoryRequest):
             for msg in request.conversation_history
         )
         
-        prompt = PromptTemplate(
-            input_variables=["conversation_history"],
-            template=DEPARTMENT_PROMPT
-        )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        department = await chain.arun(conversation_history=conv_history)
+        department = await run_chain("department", conversation_history=conv_history)
         return {"department": department.strip()}
     
     except Exception as e:
@@ -647,6 +627,10 @@ def get_selected_slot_from_history(conversation_history: List[Dict[str, str]]) -
     """Extract selected slot from conversation history"""
     print("Function: get_selected_slot_from_history")
     
+    tracked = get_tracked_state(conversation_history)
+    if tracked is not None:
+        return tracked.selected_slot
+    
     for msg in reversed(conversation_history):
         if msg["role"] == "system" and "selected_slot:" in msg.get("content", ""):
             try:
@@ -692,31 +676,22 @@ async def handle_booking_confirmation(request: ChatRequest, doctor: dict, select
         
         else:
             # Show booking details for confirmation
-            conv_history = "\n".join(
-                f"{msg['role'].upper()}: {msg['content']}"
-                for msg in request.conversation_history if msg['role'] != "system"
-            )
-            
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(
-                    BOOKING_CONFIRMATION_PROMPT.format(
-                        doctor_name=doctor['name'],
-                        doctor_department=doctor['department'],
-                        doctor_location=doctor.get('Location', 'Hospital'),
-                        selected_date=selected_slot['formatted_date'],
-                        selected_day=selected_slot['day_name'],
-                        selected_time=selected_slot['time'],
-                        selected_end_time=selected_slot['end_time'],
-                        user_input=request.user_input,
-                        language=request.language,
-                        conversation_history=conv_history
-                    )
-                ),
-                HumanMessagePromptTemplate.from_template("{user_input}"),
-            ])
+            conv_history = build_prompt_context(request.conversation_history, request.chat_history_id)
             
-            chain = LLMChain(llm=llm, prompt=prompt)
-            response = await chain.arun(user_input=request.user_input)
+            response = await run_chain(
+                "booking_confirmation",
+                stream=True,
+                doctor_name=doctor['name'],
+                doctor_department=doctor['department'],
+                doctor_location=doctor.get('Location', 'Hospital'),
+                selected_date=selected_slot['formatted_date'],
+                selected_day=selected_slot['day_name'],
+                selected_time=selected_slot['time'],
+                selected_end_time=selected_slot['end_time'],
+                user_input=request.user_input,
+                language=request.language,
+                conversation_history=conv_history
+            )
             
             return {"response": response.strip()}
             
@@ -737,26 +712,21 @@ async def handle_final_booking_confirmation(request: ChatRequest, doctor: dict,
         
         if db_result['success']:
             # Generate final confirmation message with booking ID
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(
-                    FINAL_BOOKING_CONFIRMATION_PROMPT.format(
-                        doctor_name=doctor['name'],
-                        doctor_department=doctor['department'],
-                        doctor_location=doctor.get('Location', 'Hospital'),
-                        selected_date=selected_slot['formatted_date'],
-                        selected_day=selected_slot['day_name'],
-                        selected_time=selected_slot['time'],
-                        selected_end_time=selected_slot['end_time'],
-                        language=request.language,
-                        booking_id=db_result['appointment_id'],  # Add booking ID to prompt
-                        patient_name=patient_info.get('name', 'Patient')
-                    )
-                ),
-                HumanMessagePromptTemplate.from_template("{user_input}"),
-            ])
-            
-            chain = LLMChain(llm=llm, prompt=prompt)
-            response = await chain.arun(user_input=request.user_input)
+            response = await run_chain(
+                "final_booking_confirmation",
+                stream=True,
+                doctor_name=doctor['name'],
+                doctor_department=doctor['department'],
+                doctor_location=doctor.get('Location', 'Hospital'),
+                selected_date=selected_slot['formatted_date'],
+                selected_day=selected_slot['day_name'],
+                selected_time=selected_slot['time'],
+                selected_end_time=selected_slot['end_time'],
+                language=request.language,
+                booking_id=db_result['appointment_id'],  # Add booking ID to prompt
+                patient_name=patient_info.get('name', 'Patient'),
+                user_input=request.user_input
+            )
             
             # Add booking success information to response
             final_response = f"{response.strip()}\n\n✅ Booking Reference ID: {db_result['appointment_id']}"
@@ -766,24 +736,19 @@ async def handle_final_booking_confirmation(request: ChatRequest, doctor: dict,
             # Database storage failed, but still show confirmation
             logger.error(f"Database storage failed: {db_result['error']}")
             
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(
-                    FINAL_BOOKING_CONFIRMATION_PROMPT.format(
-                        doctor_name=doctor['name'],
-                        doctor_department=doctor['department'],
-                        doctor_location=doctor.get('Location', 'Hospital'),
-                        selected_date=selected_slot['formatted_date'],
-                        selected_day=selected_slot['day_name'],
-                        selected_time=selected_slot['time'],
-                        selected_end_time=selected_slot['end_time'],
-                        language=request.language
-                    )
-                ),
-                HumanMessagePromptTemplate.from_template("{user_input}"),
-            ])
-            
-            chain = LLMChain(llm=llm, prompt=prompt)
-            response = await chain.arun(user_input=request.user_input)
+            response = await run_chain(
+                "final_booking_confirmation",
+                stream=True,
+                doctor_name=doctor['name'],
+                doctor_department=doctor['department'],
+                doctor_location=doctor.get('Location', 'Hospital'),
+                selected_date=selected_slot['formatted_date'],
+                selected_day=selected_slot['day_name'],
+                selected_time=selected_slot['time'],
+                selected_end_time=selected_slot['end_time'],
+                language=request.language,
+                user_input=request.user_input
+            )
             
             # Add warning about database issue
             final_response = f"{response.strip()}\n\n⚠️ Note: There was an issue saving your booking details. Please contact support if needed."
@@ -1,22 +1,47 @@
 import logging
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate
-from langchain.chains import LLMChain
+import os
+from typing import List
 
-# Import llm from settings
-from config.settings import llm, logger
-from models.prompts import GREETING_AGENT_PROMPT
-# Agentic System Prompts
+# Import logger from settings and the shared LLM runner
+from config.settings import logger
+from utils.llm_utils import run_chain, emit_text
+from utils.llm_cache import greeting_pool
+
+# Languages whose greeting pool is filled at startup, e.g. "English,Hindi"
+GREETING_WARM_LANGUAGES = [
+    language.strip() for language in os.getenv("GREETING_WARM_LANGUAGES", "").split(",") if language.strip()
+]
+
+async def _new_greeting(language: str, stream: bool = False, priority: str = None) -> str:
+    response = await run_chain("greeting", stream=stream, priority=priority, language=language)
+    greeting = response.strip()
+    greeting_pool.add(language, greeting)
+    return greeting
 
 async def generate_greeting(language: str) -> str:
     print("Function: generate_greeting")
     """Generate dynamic, personalized greeting"""
     try:
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(GREETING_AGENT_PROMPT.format(language=language))
-        ])
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = await chain.arun(input="")
-        return response.strip()
+        # The greeting only depends on language, so reuse a pooled variant when available
+        greeting = greeting_pool.pick(language)
+        if greeting:
+            await emit_text(greeting)
+            return greeting
+        return await _new_greeting(language, stream=True)
     except Exception as e:
         logger.error(f"Greeting generation error: {str(e)}")
         return "Hello! How can I help you today? I can assist with medical diagnosis questions or appointment booking."
+
+async def warm_greeting_pool(languages: List[str] = None):
+    """Pre-generate greeting variants so first turns skip the LLM"""
+    print("Function: warm_greeting_pool")
+    for language in languages if languages is not None else GREETING_WARM_LANGUAGES:
+        while not greeting_pool.is_full(language):
+            try:
+                before = greeting_pool.count(language)
+                await _new_greeting(language, priority="background")
+                if greeting_pool.count(language) == before:
+                    break  # duplicate or empty completion; stop rather than loop
+            except Exception as e:
+                logger.error(f"Greeting pool warm-up error for {language}: {str(e)}")
+                break
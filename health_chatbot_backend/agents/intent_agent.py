@@ -1,59 +1,141 @@
 import logging
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain.chains import LLMChain
+import re
+from typing import Optional
 
-# Import llm from settings
-from config.settings import llm, logger
+# Import logger from settings and the shared LLM runner
+from config.settings import logger
+from utils.llm_utils import run_chain
+from utils.llm_gateway import LLMOverloadedError
 # Import utilities
 from utils.conversation_utils import get_conversation_context
-from models.prompts import INTENT_DETECTION_PROMPT
 
-async def detect_user_intent(user_input: str, language: str, context: str = "") -> str:
+# ===== RULE-BASED FAST PATH =====
+# Obvious replies are classified here; only ambiguous input reaches the LLM.
+ANSWER_OPTION_PATTERN = re.compile(r"^\(?[a-d]\)?[.)]?$", re.IGNORECASE)
+CONFIRMATION_PATTERN = re.compile(
+    r"^(yes|yeah|yep|ok|okay|sure|confirm|confirmed|proceed|go ahead|correct|book it|looks good|sounds good)\b"
+)
+SELECTION_PATTERN = re.compile(r"^(\d{1,2}|first|second|third|fourth|fifth|1st|2nd|3rd|4th|5th)\b")
+SLOT_PATTERN = re.compile(
+    r"\b\d{1,2}(:\d{2})?\s*(am|pm)\b|\b\d{1,2}:\d{2}\b"
+    r"|\b(monday|tuesday|wednesday|thursday|friday|saturday|tomorrow)\b"
+)
+CITY_PATTERN = re.compile(r"\b(kanpur|orai|jhansi)\b")
+DEPARTMENT_PATTERN = re.compile(
+    r"\b(cardio\w*|heart|pediatric\w*|child|ortho\w*|bone|dermatolog\w*|skin|ent|neuro\w*"
+    r"|psychiatr\w*|dentist|dental|gyn\w*|physician|general medicine)\b"
+)
+DOCTOR_NAME_PATTERN = re.compile(r"\b(dr\.?|doctor)\s+[a-z]+")
+APPOINTMENT_PATTERN = re.compile(
+    r"\b(appointment|book|booking|schedule|find a doctor|see a doctor|consult a doctor|visit a doctor)\b"
+)
+DIAGNOSIS_SWITCH_PATTERN = re.compile(r"\b(diagnos\w*|symptoms?)\b")
+SYMPTOM_PATTERN = re.compile(
+    r"\b(fever|pain|ache|aches|headache|cough|cold|vomit\w*|nausea|rash|dizz\w*|breath\w*"
+    r"|bleed\w*|swelling|itch\w*|tired|fatigue|sore|diarrh\w*|infection)\b"
+)
+
+# Per-tier hit counters (rules vs LLM fallback)
+intent_tier_stats = {"rules": 0, "llm": 0, "llm_errors": 0}
+
+
+def classify_intent_by_rules(user_input: str, current_flow: str = None) -> Optional[str]:
+    """Deterministic intent for unambiguous input, or None to defer to the LLM"""
+    text = " ".join(user_input.lower().split())
+    if not text:
+        return None
+
+    if current_flow == "appointment":
+        if DIAGNOSIS_SWITCH_PATTERN.search(text):
+            return "SWITCH_TO_DIAGNOSIS"
+        if (CONFIRMATION_PATTERN.match(text) or SELECTION_PATTERN.match(text)
+                or SLOT_PATTERN.search(text) or CITY_PATTERN.search(text)
+                or DEPARTMENT_PATTERN.search(text) or DOCTOR_NAME_PATTERN.search(text)
+                or APPOINTMENT_PATTERN.search(text)):
+            return "APPOINTMENT"
+        return None
+
+    # Answer to a multiple-choice diagnosis question
+    if ANSWER_OPTION_PATTERN.match(text):
+        return "DIAGNOSIS"
+
+    wants_appointment = bool(APPOINTMENT_PATTERN.search(text))
+    if current_flow == "diagnosis":
+        if wants_appointment:
+            return "SWITCH_TO_APPOINTMENT"
+        if SYMPTOM_PATTERN.search(text):
+            return "DIAGNOSIS"
+        return None
+
+    describes_symptoms = bool(SYMPTOM_PATTERN.search(text) or DIAGNOSIS_SWITCH_PATTERN.search(text))
+    if wants_appointment and not describes_symptoms:
+        return "APPOINTMENT"
+    if describes_symptoms and not wants_appointment:
+        return "DIAGNOSIS"
+    return None
+
+
+def get_intent_stats() -> dict:
+    total = intent_tier_stats["rules"] + intent_tier_stats["llm"]
+    return {
+        **intent_tier_stats,
+        "rule_hit_rate": round(intent_tier_stats["rules"] / total, 3) if total else 0.0,
+    }
+
+
+async def detect_user_intent(user_input: str, language: str, context: str = "", current_flow: str = None) -> str:
     print("Function: detect_user_intent")
     """Intelligently detect user's intent including flow switching"""
+    intent = classify_intent_by_rules(user_input, current_flow)
+    if intent:
+        intent_tier_stats["rules"] += 1
+        logger.info(f"Intent resolved by rules: {intent}")
+        return intent
+
+    intent_tier_stats["llm"] += 1
     try:
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(
-                INTENT_DETECTION_PROMPT.format(
-                    user_input=user_input, 
-                    language=language,
-                    context=context
-                )
-            )
-        ])
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = await chain.arun(input="")
+        response = await run_chain(
+            "intent",
+            cache=True,
+            user_input=user_input,
+            language=language,
+            context=context
+        )
         
         # Extract intent from response
         intent = response.strip().upper()
         valid_intents = ["DIAGNOSIS", "APPOINTMENT", "SWITCH_TO_APPOINTMENT", "SWITCH_TO_DIAGNOSIS", "UNCLEAR"]
         if intent in valid_intents:
             return intent
-        else:
-            return "UNCLEAR"
+        # Small classifier models sometimes wrap the label ("Intent: APPOINTMENT.");
+        # check the longer SWITCH_TO_* labels before the labels they contain
+        for label in sorted(valid_intents, key=len, reverse=True):
+            if label in intent:
+                return label
+        return "UNCLEAR"
             
+    except LLMOverloadedError:
+        # Let /chat answer 503 instead of guessing UNCLEAR under load
+        raise
     except Exception as e:
+        intent_tier_stats["llm_errors"] += 1
         logger.error(f"Intent detection error: {str(e)}")
         return "UNCLEAR"
 
 async def generate_clarification(user_input: str, language: str) -> str:
     print("Function: generate_clarification")
     """Generate clarification message when intent is unclear"""
-    clarification_prompt = f"""The user said: "{user_input}"
-
-Generate a friendly clarification message in {language} asking whether they want:
-1. Medical diagnosis/health questions
-2. Appointment booking with doctors
-
-Keep it conversational and helpful."""
-    
     try:
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(clarification_prompt)
-        ])
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = await chain.arun(input="")
+        response = await run_chain(
+            "clarification",
+            stream=True,
+            cache=True,
+            user_input=user_input,
+            language=language
+        )
         return response.strip()
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Clarification generation error: {str(e)}")
         return "I'd be happy to help! Could you let me know if you need help with medical diagnosis questions or booking an appointment with a doctor?"
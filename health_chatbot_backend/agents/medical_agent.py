@@ -1,93 +1,197 @@
 import logging
-from typing import List, Dict
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain.chains import LLMChain
-from models.database import add_option, add_question
+import os
+from typing import List, Dict, Optional
+from models.database import add_question_with_options, build_question_documents
 from models.request_models import ChatRequest
+from models.diagnosis_models import parse_diagnosis_output
 from fastapi import HTTPException
 
-# Import llm from settings
-from config.settings import llm, logger
+# Import logger from settings and the shared LLM runner
+from config.settings import logger
+from utils.llm_utils import run_chain, emit_text
 # Import utilities
 from utils.conversation_utils import count_questions_asked, update_flow_marker
-from models.prompts import MEDICAL_PROMPT
+from services.write_queue import write_queue
+from utils.context_builder import build_prompt_context
+from services.option_cache import option_cache
+from services.question_bank import question_bank, answer_path
+from utils.conversation_state import append_message, QUESTION_MARKER
 
+# "structured": JSON output validated against DiagnosisOutput; "text": free text parsed line by line
+DIAGNOSIS_OUTPUT_MODE = os.getenv("DIAGNOSIS_OUTPUT_MODE", "structured")
+# Most LLM calls one diagnosis turn may make, counting a speculated generation and
+# the free-text fallback; structured attempts get all but the last one
+DIAGNOSIS_MAX_LLM_CALLS = max(int(os.getenv("DIAGNOSIS_MAX_LLM_CALLS", "2")), 2)
 
 
 
+
+async def generate_diagnosis_response(request: ChatRequest, question_count: int) -> str:
+    """The LLM part of a diagnosis turn; has no side effects, so it can be started speculatively"""
+    conv_history = build_prompt_context(request.conversation_history, request.chat_history_id)
+
+    # Structured output is parsed before anything reaches the user, so it is not streamed
+    structured = DIAGNOSIS_OUTPUT_MODE == "structured"
+    return await run_chain(
+        "medical_structured" if structured else "medical",
+        stream=not structured,
+        conversation_history=conv_history,
+        language=request.language,
+        question_count=question_count,
+        department=request.department,
+        user_input=request.user_input
+    )
+
+
+def parse_text_question(llm_response: str):
+    """Question text and A-D options from the free-text prompt's output"""
+    response_lines = llm_response.strip().split('\n')
+    question_text = ""
+    options = []
+    for line in response_lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(('A.', 'B.', 'C.', 'D.')):
+            parts = line.split('(', 1)
+            option_text = parts[0].split('.', 1)[1].strip()
+            ehr_terminology = parts[1][:-1].strip() if len(parts) > 1 else ""
+            options.append({
+                "option_no": line[0],
+                "option_text": option_text,
+                "ehr_terminology": ehr_terminology
+            })
+        else:
+            question_text += line + " "
+    return question_text.strip(), options
+
+
+async def store_diagnosis_question(request: ChatRequest, question_count: int, question_text: str, options: list,
+                                   learn: bool = True):
+    question_data = {
+        "chat_history_id": request.chat_history_id,
+        "question_no": question_count + 1,
+        "question_text": question_text
+    }
+    # Which question and answer led here, so the bank only reuses it on the same path
+    path = answer_path(request.conversation_history, request.user_input)
+    if path is not None:
+        question_data["follows"] = {"question": path[0], "answer": path[1]}
+    question_doc, option_docs = build_question_documents(question_data, options)
+    current_question_id = question_doc["_id"]
+    option_cache.remember(request.chat_history_id, current_question_id, option_docs)
+    # Ids are assigned client-side, so the write can happen off the response path
+    await write_queue.submit(
+        "question_with_options",
+        lambda: add_question_with_options(question_doc, option_docs),
+        key=str(current_question_id)
+    )
+    # Exact question count for the conversation state, no re-detection needed
+    append_message(request.conversation_history, {
+        "role": "system",
+        "content": f"{QUESTION_MARKER} {question_count + 1}"
+    })
+    if learn:
+        question_bank.learn(request.department, request.language, question_count + 1, question_text, options, path)
+    logger.info(f"Question {current_question_id} with {len(option_docs)} options queued for chat {request.chat_history_id}")
+    return current_question_id
+
+
+def find_bank_question(request: ChatRequest, question_count: int, record: bool = True):
+    """A stored question that fits this turn, so the LLM can be skipped"""
+    if question_count >= 5:
+        return None  # that turn recommends an appointment instead
+    return question_bank.find(
+        request.department, request.language, question_count + 1, request.conversation_history,
+        path=answer_path(request.conversation_history, request.user_input), record=record
+    )
+
+
+def render_bank_question(entry) -> str:
+    lines = [entry.question_text]
+    for option in entry.options:
+        ehr = f" ({option['ehr_terminology']})" if option.get("ehr_terminology") else ""
+        lines.append(f"{option['option_no']}. {option['option_text']}{ehr}")
+    return "\n\n".join(lines)
+
+
+def question_payload(request: ChatRequest, response_text: str, question_id, question_count: int) -> dict:
+    """/chat payload for a stored question; question_count lets clients keep exact state without the server-side marker"""
+    return {
+        "response": response_text,
+        "chat_history_id": request.chat_history_id,
+        "question_id": str(question_id),
+        "question_count": question_count + 1
+    }
+
+
+async def structured_diagnosis_turn(request: ChatRequest, question_count: int, llm_response: Optional[str]):
+    """Validated question or recommendation, retrying invalid JSON within the turn's call budget"""
+    # One call is kept for the free-text fallback
+    for attempt in range(DIAGNOSIS_MAX_LLM_CALLS - 1):
+        if llm_response is None:
+            llm_response = await generate_diagnosis_response(request, question_count)
+        output = parse_diagnosis_output(llm_response)
+        if output is not None:
+            return output
+        logger.warning(f"Invalid structured diagnosis output (attempt {attempt + 1}): {llm_response[:200]}")
+        llm_response = None
+    return None
+
+
 # <<< MODIFIED: Function signature and logic to save to DB
-async def handle_diagnosis_flow(request: ChatRequest, question_count: int = None):
+async def handle_diagnosis_flow(request: ChatRequest, question_count: int = None, llm_response: Optional[str] = None):
     print("Function: handle_diagnosis_flow")
     """Handle diagnosis flow, save question/options to DB, and return IDs."""
     try:
         if question_count is None:
             question_count = count_questions_asked(request.conversation_history)
 
-        conv_history = "\n".join(
-            f"{msg['role'].upper()}: {msg['content']}"
-            for msg in request.conversation_history if msg['role'] != "system"
-        )
-
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(
-                MEDICAL_PROMPT.format(
-                    conversation_history=conv_history,
-                    language=request.language,
-                    question_count=question_count,
-                    department=request.department
-                )
-            ),
-            HumanMessagePromptTemplate.from_template("{user_input}"),
-        ])
-
-        chain = LLMChain(llm=llm, prompt=prompt)
-        llm_response = await chain.arun(user_input=request.user_input)
+        # Reuse a stored question when one fits, unless a generation was already paid for
+        entry = find_bank_question(request, question_count) if llm_response is None else None
+        if entry is not None:
+            response_text = render_bank_question(entry)
+            await emit_text(response_text)
+            options = [
+                {"option_no": option["option_no"], "option_text": option["option_text"], "ehr_terminology": option.get("ehr_terminology", "")}
+                for option in entry.options
+            ]
+            current_question_id = await store_diagnosis_question(
+                request, question_count, entry.question_text, options, learn=False
+            )
+            return question_payload(request, response_text, current_question_id, question_count)
+
+        if DIAGNOSIS_OUTPUT_MODE == "structured":
+            output = await structured_diagnosis_turn(request, question_count, llm_response)
+            if output is not None:
+                response_text = output.render()
+                await emit_text(response_text)
+                if output.type == "question":
+                    options = [
+                        {"option_no": option.option_no, "option_text": option.text, "ehr_terminology": option.ehr_terminology}
+                        for option in output.options
+                    ]
+                    current_question_id = await store_diagnosis_question(request, question_count, output.question, options)
+                    return question_payload(request, response_text, current_question_id, question_count)
+                return {"response": response_text, "chat_history_id": request.chat_history_id}
+            # Out of structured attempts: the last call of the budget uses the free-text prompt
+            llm_response = await run_chain(
+                "medical",
+                stream=True,
+                conversation_history=build_prompt_context(request.conversation_history, request.chat_history_id),
+                language=request.language,
+                question_count=question_count,
+                department=request.department,
+                user_input=request.user_input
+            )
+        elif llm_response is None:
+            llm_response = await generate_diagnosis_response(request, question_count)
 
         # <<< MODIFIED: Parse response and save to database
-        response_lines = llm_response.strip().split('\n')
-        question_text = ""
-        options = []
-        for line in response_lines:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith(('A.', 'B.', 'C.', 'D.')):
-                parts = line.split('(', 1)
-                option_text = parts[0].split('.', 1)[1].strip()
-                ehr_terminology = parts[1][:-1].strip() if len(parts) > 1 else ""
-                options.append({
-                    "option_no": line[0],
-                    "option_text": option_text,
-                    "ehr_terminology": ehr_terminology
-                })
-            else:
-                question_text += line + " "
-
-        question_text = question_text.strip()
-        current_question_id = None
+        question_text, options = parse_text_question(llm_response)
         if question_text and len(options) == 4:
-            question_data = {
-                "chat_history_id": request.chat_history_id,
-                "question_no": question_count + 1,
-                "question_text": question_text
-            }
-            current_question_id = await add_question(question_data)
-            logger.info(f"Question stored with ID: {current_question_id} for chat {request.chat_history_id}")
-
-            for option in options:
-                await add_option({
-                    "question_id": current_question_id,
-                    "option_no": option["option_no"],
-                    "option_text": option["option_text"],
-                    "ehr_terminology": option["ehr_terminology"]
-                })
-            logger.info(f"Stored {len(options)} options for question {current_question_id}")
-
-            return {
-                "response": llm_response.strip(),
-                "chat_history_id": request.chat_history_id,
-                "question_id": str(current_question_id)
-            }
+            current_question_id = await store_diagnosis_question(request, question_count, question_text, options)
+            return question_payload(request, llm_response.strip(), current_question_id, question_count)
         else:
             logger.warning(f"Failed to parse question and options from LLM response: {llm_response}")
             # Fallback to returning raw response if parsing fails
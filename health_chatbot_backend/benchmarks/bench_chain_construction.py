@@ -0,0 +1,70 @@
+"""Per-call prompt/chain construction cost: inline LLMChain vs the chain registry.
+
+Run from health_chatbot_backend/:
+
+    python -m benchmarks.bench_chain_construction [iterations]
+
+The LLM is never called; only the work done before a request reaches Ollama
+is measured.
+"""
+import sys
+import time
+
+from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
+from langchain.chains import LLMChain
+
+from config.settings import llm
+from models.prompts import MEDICAL_PROMPT
+from utils.chain_registry import get_chain
+
+CONVERSATION = "\n".join(
+    f"{'USER' if i % 2 else 'ASSISTANT'}: message number {i} about chest pain and fatigue"
+    for i in range(20)
+)
+VARIABLES = {
+    "conversation_history": CONVERSATION,
+    "language": "English",
+    "question_count": 3,
+    "department": "Cardiology",
+    "user_input": "B",
+}
+
+
+def per_call_construction():
+    """What every agent function did before the registry existed"""
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(
+            MEDICAL_PROMPT.format(
+                conversation_history=VARIABLES["conversation_history"],
+                language=VARIABLES["language"],
+                question_count=VARIABLES["question_count"],
+                department=VARIABLES["department"]
+            )
+        ),
+        HumanMessagePromptTemplate.from_template("{user_input}"),
+    ])
+    chain = LLMChain(llm=llm, prompt=prompt)
+    return chain.prompt.format_messages(user_input=VARIABLES["user_input"])
+
+
+def registry_binding():
+    chain = get_chain("medical")
+    return chain.prompt.format_messages(**chain.bind(VARIABLES))
+
+
+def measure(func, iterations: int) -> float:
+    func()  # warm-up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = measure(per_call_construction, iterations)
+    after = measure(registry_binding, iterations)
+    print(f"iterations:              {iterations}")
+    print(f"per-call construction:   {before:8.1f} us/call")
+    print(f"registry variable bind:  {after:8.1f} us/call")
+    print(f"speed-up:                {before / after:8.1f}x")
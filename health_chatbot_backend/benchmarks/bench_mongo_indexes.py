@@ -0,0 +1,126 @@
+"""Query latency of the /chat and report lookups with and without the bootstrap indexes.
+
+Run from health_chatbot_backend/ against a local MongoDB:
+
+    python -m benchmarks.bench_mongo_indexes [chats] [lookups]
+
+Seeds a throw-away database (health_chatbot_bench, dropped afterwards) with
+``chats`` synthetic conversations of 10 questions (4 options embedded, as
+add_question_with_options stores them) and 1 answer per question, then times
+the three hot lookups before and after INDEX_SPECS is applied, and prints
+the plan MongoDB picks for each so a lookup left without an index shows up
+as COLLSCAN.
+"""
+import random
+import sys
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from models.database import INDEX_SPECS, MONGO_DETAILS, build_question_documents, embed_options, embedded_option_query
+
+BENCH_DATABASE = "health_chatbot_bench"
+QUESTIONS_PER_CHAT = 10
+
+
+def seed(db, chats: int):
+    questions, answers = [], []
+    for chat in range(chats):
+        chat_history_id = f"patient_{chat}"
+        for question_no in range(1, QUESTIONS_PER_CHAT + 1):
+            question_doc, option_docs = build_question_documents(
+                {
+                    "chat_history_id": chat_history_id,
+                    "question_no": question_no,
+                    "question_text": f"Question {question_no} for {chat_history_id}",
+                },
+                [{"option_no": option_no, "option_text": f"Option {option_no}", "ehr_terminology": ""}
+                 for option_no in "ABCD"]
+            )
+            questions.append(embed_options(question_doc, option_docs))
+            answers.append({"question_id": question_doc["_id"], "answer_id": random.choice(option_docs)["_id"]})
+    db["question"].insert_many(questions, ordered=False)
+    db["answer"].insert_many(answers, ordered=False)
+    return [(q["_id"], q["chat_history_id"]) for q in questions]
+
+
+def lookup_queries(question_id: ObjectId, chat_history_id: str):
+    """(label, collection, filter, projection, sort) of the queries answer recording and reports issue"""
+    option_filter, option_projection = embedded_option_query(question_id, "B")
+    return [
+        ("find_option", "question", option_filter, option_projection, None),
+        ("chat questions", "question", {"chat_history_id": chat_history_id}, None, [("question_no", 1)]),
+        ("answer", "answer", {"question_id": question_id}, None, None),
+    ]
+
+
+def lookups(db, sample):
+    for question_id, chat_history_id in sample:
+        for _, collection, query, projection, sort in lookup_queries(question_id, chat_history_id):
+            cursor = db[collection].find(query, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            list(cursor.limit(0 if sort else 1))
+
+
+def plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+def print_plans(db, question_id: ObjectId, chat_history_id: str):
+    for label, collection, query, projection, sort in lookup_queries(question_id, chat_history_id):
+        cursor = db[collection].find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = plan_stages(winning.get("queryPlan", winning))
+        print(f"  {label:<16} {' <- '.join(stage for stage in stages if stage)}")
+
+
+def measure(db, sample) -> float:
+    started = time.perf_counter()
+    lookups(db, sample)
+    return (time.perf_counter() - started) / len(sample) * 1000
+
+
+def create_indexes(db) -> float:
+    started = time.perf_counter()
+    for collection_name, specs in INDEX_SPECS.items():
+        for name, keys in specs:
+            db[collection_name].create_index(keys, name=name)
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    lookup_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    client = MongoClient(MONGO_DETAILS)
+    client.drop_database(BENCH_DATABASE)
+    db = client[BENCH_DATABASE]
+    try:
+        started = time.perf_counter()
+        question_refs = seed(db, chats)
+        seed_seconds = time.perf_counter() - started
+        sample = random.sample(question_refs, min(lookup_count, len(question_refs)))
+
+        without = measure(db, sample)
+        build_ms = create_indexes(db)
+        measure(db, sample[:10])  # warm the new indexes
+        with_indexes = measure(db, sample)
+        print("query plans with indexes:")
+        print_plans(db, *sample[0])
+
+        print(f"chats / questions:       {chats} / {len(question_refs)}")
+        print(f"seed time:               {seed_seconds:8.1f} s")
+        print(f"index build:             {build_ms:8.1f} ms")
+        print(f"lookups without indexes: {without:8.2f} ms/turn")
+        print(f"lookups with indexes:    {with_indexes:8.2f} ms/turn")
+        print(f"speed-up:                {without / with_indexes:8.1f}x")
+    finally:
+        client.drop_database(BENCH_DATABASE)
+        client.close()
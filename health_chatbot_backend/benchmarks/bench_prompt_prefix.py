@@ -0,0 +1,87 @@
+"""Ollama prefill time per diagnosis turn: inline prompts vs stable-prefix prompts.
+
+Run from health_chatbot_backend/ with an Ollama server available:
+
+    OLLAMA_BASE_URL=http://localhost:11434 python -m benchmarks.bench_prompt_prefix [turns] [model]
+
+Replays a growing diagnosis conversation through MEDICAL_PROMPT assembled in
+both modes (see PROMPT_ASSEMBLY_MODE in utils/chain_registry.py) and reads
+prompt_eval_count / prompt_eval_duration from Ollama's responses. Tokens
+Ollama served from its KV cache are not re-evaluated, so a shared prefix
+shows up as fewer evaluated tokens and a shorter prefill.
+"""
+import json
+import os
+import sys
+import urllib.request
+
+from models.prompts import MEDICAL_PROMPT
+from utils.chain_registry import compile_prompt
+
+ROLE_NAMES = {"system": "system", "human": "user", "ai": "assistant"}
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+
+
+def ollama_chat(base_url: str, model: str, messages: list) -> dict:
+    body = json.dumps({
+        "model": model,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": KEEP_ALIVE,
+        # Only prefill is measured; keep generation short
+        "options": {"num_predict": 1, "temperature": 0},
+    }).encode("utf-8")
+    request = urllib.request.Request(f"{base_url}/api/chat", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.loads(response.read())
+
+
+def simulated_turns(turns: int):
+    history = []
+    for turn in range(turns):
+        yield {
+            "conversation_history": "\n".join(history),
+            "language": "English",
+            "question_count": turn,
+            "department": "Cardiology",
+            "user_input": "B",
+        }
+        history.append(
+            f"ASSISTANT: Question {turn + 1}: How often do you feel chest discomfort during activity?\n"
+            "A. Never (Asymptomatic)\nB. Occasionally (Intermittent angina)\n"
+            "C. Frequently (Stable angina)\nD. At rest (Unstable angina)"
+        )
+        history.append("USER: B")
+
+
+def run_mode(base_url: str, model: str, mode: str, turns: int):
+    prompt = compile_prompt(MEDICAL_PROMPT, "system_human", mode)
+    evaluated, prefill_ms = [], []
+    for variables in simulated_turns(turns):
+        messages = [
+            {"role": ROLE_NAMES.get(message.type, "user"), "content": message.content}
+            for message in prompt.format_messages(**variables)
+        ]
+        result = ollama_chat(base_url, model, messages)
+        evaluated.append(result.get("prompt_eval_count", 0))
+        prefill_ms.append(result.get("prompt_eval_duration", 0) / 1e6)
+    return evaluated, prefill_ms
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    model = sys.argv[2] if len(sys.argv) > 2 else "llama3"
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+    # Warm the model so load time is not counted as prefill
+    ollama_chat(base_url, model, [{"role": "user", "content": "hi"}])
+
+    print(f"{'mode':<14} {'turn':>4} {'evaluated tokens':>17} {'prefill ms':>11}")
+    totals = {}
+    for mode in ("inline", "stable_prefix"):
+        evaluated, prefill_ms = run_mode(base_url, model, mode, turns)
+        for turn, (tokens, ms) in enumerate(zip(evaluated, prefill_ms), 1):
+            print(f"{mode:<14} {turn:>4} {tokens:>17} {ms:>11.1f}")
+        totals[mode] = sum(prefill_ms)
+    print(f"total prefill: inline {totals['inline']:.1f} ms, stable_prefix {totals['stable_prefix']:.1f} ms")
+    if totals["stable_prefix"]:
+        print(f"reduction:     {(1 - totals['stable_prefix'] / totals['inline']) * 100:.0f}%")
@@ -0,0 +1,87 @@
+"""Per-report PDF render time and peak memory: per-call styles vs the shared template.
+
+Run from health_chatbot_backend/:
+
+    python -m benchmarks.bench_report_render [repeats]
+
+Renders synthetic reports of about 1, 10 and 100 pages. No LLM or worker
+process is involved; only the ReportLab work in a render worker is measured.
+"""
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_LEFT
+
+from services.report_renderer import render_consultation_pdf
+
+# Roughly how many body sections of SECTION_TEXT fit on a letter page
+SECTIONS_PER_PAGE = 7
+SECTION_TEXT = (
+    "The patient reports intermittent chest discomfort on exertion, relieved by rest, "
+    "with occasional shortness of breath and fatigue over the last three weeks."
+)
+
+
+def synthetic_report(pages: int) -> str:
+    sections = []
+    for i in range(pages * SECTIONS_PER_PAGE):
+        if i % SECTIONS_PER_PAGE == 0:
+            sections.append(f"Section {i // SECTIONS_PER_PAGE + 1}:")
+        sections.append(SECTION_TEXT)
+    return "\n\n".join(sections)
+
+
+def per_call_render(name, gender, age, report_text) -> bytes:
+    """How generate_report rendered before the shared template existed"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    base_styles = getSampleStyleSheet()
+    heading_style = ParagraphStyle('Heading', parent=base_styles['Heading2'], fontSize=14, spaceAfter=10,
+                                   spaceBefore=12, leftIndent=0, alignment=TA_LEFT, fontName='Helvetica-Bold')
+    body_style = ParagraphStyle('Body', parent=base_styles['Normal'], fontSize=11, leading=16, leftIndent=20)
+    story = [Paragraph("Medical Consultation Report", heading_style), Spacer(1, 12),
+             Paragraph("Patient Details", heading_style), Spacer(1, 6),
+             Paragraph(f"Name: {name}", body_style), Paragraph(f"Gender: {gender}", body_style),
+             Paragraph(f"Age: {age}", body_style), Spacer(1, 12)]
+    for paragraph in report_text.split('\n\n'):
+        stripped = paragraph.strip()
+        if not stripped:
+            continue
+        if stripped.endswith(":"):
+            story.append(Spacer(1, 10))
+            story.append(Paragraph(stripped, heading_style))
+        else:
+            story.append(Paragraph(stripped, body_style))
+        story.append(Spacer(1, 6))
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def measure(render, report_text: str, repeats: int):
+    render("Asha", "Female", 42, report_text)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        pdf = render("Asha", "Female", 42, report_text)
+    elapsed_ms = (time.perf_counter() - started) / repeats * 1000
+
+    tracemalloc.start()
+    render("Asha", "Female", 42, report_text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024, len(pdf) / 1024
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'pages':>5}  {'renderer':<10} {'ms/report':>10} {'peak KiB':>10} {'pdf KiB':>9}")
+    for pages in (1, 10, 100):
+        report_text = synthetic_report(pages)
+        page_repeats = max(1, repeats if pages < 100 else repeats // 5)
+        for label, render in (("per-call", per_call_render), ("template", render_consultation_pdf)):
+            elapsed_ms, peak_kib, pdf_kib = measure(render, report_text, page_repeats)
+            print(f"{pages:>5}  {label:<10} {elapsed_ms:>10.1f} {peak_kib:>10.0f} {pdf_kib:>9.0f}")
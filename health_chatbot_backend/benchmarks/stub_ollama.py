@@ -0,0 +1,107 @@
+"""Minimal stand-in for the Ollama HTTP API, for exercising the LLM backend pool.
+
+Run one stub per port from health_chatbot_backend/:
+
+    python -m benchmarks.stub_ollama 11435 --delay 0.05 &
+    python -m benchmarks.stub_ollama 11436 --delay 0.05 &
+    OLLAMA_BACKENDS=http://localhost:11435,http://localhost:11436 uvicorn main:app
+
+Implements GET /api/tags and POST /api/chat (streamed or not); chat requests
+for any model other than --model get Ollama's 404 "model not found". Each reply
+names the port that served it, so balancing and failover are visible in the
+responses; kill a stub to watch /stats/llm_backends mark it unhealthy.
+With --fail-status every chat request is answered with that HTTP status.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(port: int, model: str, delay: float, tokens: int, fail_status: int = None):
+    class StubOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload: dict, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, payload: dict):
+            data = (json.dumps(payload) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": f"{model}:latest", "model": f"{model}:latest"}]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                self._send_json({"error": "not found"}, 404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if fail_status:
+                self._send_json({"error": f"stub-{port} failing with {fail_status}"}, fail_status)
+                return
+            if request.get("model") not in (model, f"{model}:latest"):
+                # What Ollama answers for a model that has not been pulled
+                self._send_json({"error": f"model \"{request.get('model')}\" not found, try pulling it first"}, 404)
+                return
+            words = [f"stub-{port}"] + [f"token{i}" for i in range(tokens - 1)]
+            created_at = datetime.now(timezone.utc).isoformat()
+            final = {
+                "model": request.get("model", model),
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int(delay * tokens * 1e9),
+                "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in request.get("messages", [])),
+                "prompt_eval_duration": 0,
+                "eval_count": tokens,
+            }
+            if not request.get("stream", True):
+                time.sleep(delay * tokens)
+                final["message"]["content"] = " ".join(words)
+                self._send_json(final)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(words):
+                time.sleep(delay)
+                self._chunk({
+                    "model": request.get("model", model),
+                    "created_at": created_at,
+                    "message": {"role": "assistant", "content": word if i == 0 else " " + word},
+                    "done": False,
+                })
+            self._chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubOllamaHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("port", type=int)
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds per generated token")
+    parser.add_argument("--tokens", type=int, default=8)
+    parser.add_argument("--fail-status", type=int, default=None, help="answer every chat request with this HTTP status")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.port, args.model, args.delay, args.tokens, args.fail_status))
+    print(f"Stub Ollama ({args.model}) listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -10,12 +10,64 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ollama generation settings shared by every backend
+LLM_PARAMS = {
+    "model": "llama3",
+    "temperature": 0.7,
+    "max_tokens": 500,
+    "timeout": 30,
+}
+
+# Per-task generation profiles. Classification calls only need one label, so
+# they use a small model with deterministic sampling and a tiny output budget.
+# Profiles whose model no backend has pulled fall back to "default" (see utils/llm_utils.py).
+LLM_PROFILES = {
+    "default": LLM_PARAMS,
+    "classification": {
+        "model": os.getenv("LLM_CLASSIFIER_MODEL", "llama3.2:1b"),
+        "temperature": 0.0,
+        "num_predict": int(os.getenv("LLM_CLASSIFIER_MAX_TOKENS", "8")),
+        "stop": ["\n"],
+        # ChatOllama has no timeout field; the HTTP client takes it
+        "client_kwargs": {"timeout": float(os.getenv("LLM_CLASSIFIER_TIMEOUT", "10"))},
+    },
+    # Ollama constrains the output to valid JSON; the shape is checked by the caller
+    "structured_json": {
+        **LLM_PARAMS,
+        "format": "json",
+        "num_predict": int(os.getenv("LLM_STRUCTURED_MAX_TOKENS", "600")),
+    },
+}
+
+# How long Ollama keeps a model (and its cached prompt prefix) loaded between calls, e.g. "30m"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE")
+if OLLAMA_KEEP_ALIVE:
+    for _params in LLM_PROFILES.values():
+        _params.setdefault("keep_alive", OLLAMA_KEEP_ALIVE)
+
+# Which profile each registered chain uses; anything not listed uses "default".
+# Override with e.g. LLM_CHAIN_PROFILES="intent=default,department=classification"
+CHAIN_PROFILES = {
+    "intent": "classification",
+    "department": "classification",
+    "medical_structured": "structured_json",
+}
+for _entry in os.getenv("LLM_CHAIN_PROFILES", "").split(","):
+    if "=" in _entry:
+        _chain_name, _profile = (part.strip() for part in _entry.split("=", 1))
+        CHAIN_PROFILES[_chain_name] = _profile
+
+def get_profile_name(chain_name: str) -> str:
+    profile = CHAIN_PROFILES.get(chain_name, "default")
+    return profile if profile in LLM_PROFILES else "default"
+
+def build_llm(base_url: str = None, profile: str = "default") -> ChatOllama:
+    params = LLM_PROFILES[profile]
+    if base_url:
+        return ChatOllama(base_url=base_url, **params)
+    return ChatOllama(**params)
+
 # Initialize Ollama
-llm = ChatOllama(
-    model="llama3",
-    temperature=0.7,
-    max_tokens=500,
-    timeout=30
-) 
+llm = build_llm(os.getenv("OLLAMA_BASE_URL"))
 
 # You can add other global settings here if needed
\ No newline at end of file
@@ -1,11 +1,13 @@
+import asyncio
+import os
 import time
 from bson import ObjectId
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Dict, List
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from typing import Dict, List, Optional
 import re
-from models.database import add_answer, add_chat_history, close_db, connect_db,options_collection
+from models.database import add_answer, add_chat_history, close_db, connect_db, ensure_indexes, find_option, index_status
 from utils.conversation_utils import count_questions_asked
 
 # Import settings (including llm and logger)
@@ -14,18 +16,36 @@ from config.settings import llm, logger
 # Import Pydantic models
 from models.request_models import (
     ChatRequest, HistoryRequest, OfflineReportRequest,
-    LocationRequest, DoctorSelectionRequest, SlotBookingRequest
+    LocationRequest, DoctorSelectionRequest, SlotBookingRequest,
+    BatchAvailabilityRequest
 )
 
 # Import agent functions
-from agents.greeting_agent import generate_greeting
-from agents.intent_agent import detect_user_intent, generate_clarification
-from agents.medical_agent import handle_diagnosis_flow
+from agents.greeting_agent import generate_greeting, warm_greeting_pool
+from agents.intent_agent import detect_user_intent, generate_clarification, get_intent_stats
+from agents.medical_agent import handle_diagnosis_flow, generate_diagnosis_response, find_bank_question
 from agents.appointment_agent import handle_enhanced_appointment_flow_with_confirmation,suggest_department # Renamed for clarity in main.py, was suggest_department_func
 
 # Import service functions
 from services.report_service import generate_report, generate_offline_report
-from utils.conversation_utils import get_current_flow, update_flow_marker, get_conversation_context
+from services.db_pool import db_pool, init_db_pool, close_db_pool
+from services.doctor_directory import doctor_directory
+from services.database_service import get_doctors_by_ids, get_doctors_available_slots
+from services.slot_engine import first_free_slot
+from services.session_store import Session, session_store
+from services.write_queue import write_queue
+from services.render_pool import render_pool
+from services.report_jobs import report_jobs, ReportQueueFullError
+from services.report_cache import report_cache, etag_matches
+from services.question_bank import question_bank
+from services.option_cache import option_cache
+from utils.conversation_utils import get_current_flow, update_flow_marker, get_conversation_context, add_flow_marker_from_input
+from utils.conversation_state import ConversationState, track_conversation
+from utils.llm_utils import stream_tokens_to, format_sse, llm_session, current_token_sink, DeferredSink
+from utils.llm_cache import llm_cache, greeting_pool
+from utils.llm_gateway import llm_gateway, is_overload_error
+from utils.llm_backends import llm_backends
+from utils.context_builder import summary_cache
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +53,10 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Start the active flow's LLM work concurrently with intent detection
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "false").lower() in ("1", "true", "yes")
+speculation_stats = {"hits": 0, "wasted": 0, "wasted_completed": 0}
+
 
 
 app.add_middleware(
@@ -49,10 +73,93 @@ async def read_root():
 @app.on_event("startup")
 async def startup_db_client():
     await connect_db()
+    await ensure_indexes()
+    await init_db_pool()
+    write_queue.start()
+    render_pool.open()
+    report_jobs.start()
+
+@app.on_event("startup")
+async def warm_llm_caches():
+    llm_backends.start()
+    asyncio.create_task(question_bank.load())
+    # Runs in the background so startup doesn't wait on the LLM
+    asyncio.create_task(warm_greeting_pool())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Flush queued Mongo writes before the client goes away
+    await report_jobs.close()
+    await write_queue.close()
     await close_db()
+    await close_db_pool()
+    render_pool.close()
+    await llm_backends.close()
+
+@app.get("/stats/db_pool")
+async def db_pool_stats():
+    return db_pool.stats()
+
+@app.get("/stats/intent")
+async def intent_stats():
+    return get_intent_stats()
+
+@app.get("/stats/llm_cache")
+async def llm_cache_stats():
+    return {"results": llm_cache.stats(), "greetings": greeting_pool.stats()}
+
+@app.get("/stats/question_bank")
+async def question_bank_stats():
+    return question_bank.stats()
+
+@app.get("/stats/speculation")
+async def speculation_statistics():
+    decided = speculation_stats["hits"] + speculation_stats["wasted"]
+    return {
+        "enabled": SPECULATIVE_ROUTING,
+        **speculation_stats,
+        "hit_rate": round(speculation_stats["hits"] / decided, 3) if decided else 0.0,
+    }
+
+@app.get("/stats/llm_gateway")
+async def llm_gateway_stats():
+    return llm_gateway.stats()
+
+@app.get("/stats/llm_backends")
+async def llm_backend_stats():
+    return llm_backends.stats()
+
+@app.get("/stats/sessions")
+async def session_stats():
+    return {**session_store.stats(), "context_summaries": summary_cache.stats()}
+
+@app.get("/stats/indexes")
+async def mongo_index_stats():
+    return index_status
+
+@app.get("/stats/write_queue")
+async def write_queue_stats():
+    return {"queue": write_queue.stats(), "option_cache": option_cache.stats()}
+
+@app.get("/stats/render_pool")
+async def render_pool_stats():
+    return render_pool.stats()
+
+@app.get("/stats/report_jobs")
+async def report_job_stats():
+    return {"jobs": report_jobs.stats(), "cache": report_cache.stats()}
+
+@app.get("/stats/doctor_directory")
+async def doctor_directory_stats():
+    return doctor_directory.stats()
+
+@app.post("/doctor_directory/refresh")
+async def refresh_doctor_directory():
+    try:
+        await doctor_directory.refresh()
+    except Exception:
+        raise HTTPException(503, "Doctor directory refresh failed")
+    return doctor_directory.stats()
 
 
 @app.post("/chat")
@@ -61,6 +168,7 @@ async def chat(request: ChatRequest):
     try:
         # <<< MODIFIED: Handle chat history creation and answer storage
         chat_history_id = request.chat_history_id
+        is_new_chat = not chat_history_id
         user_input_upper = request.user_input.strip().upper()
 
         # 1. If no chat_history_id, this is a new chat. Create a record.
@@ -77,100 +185,304 @@ async def chat(request: ChatRequest):
             })
             request.chat_history_id = chat_history_id
             logger.info(f"New chat history created with ID: {chat_history_id}")
-        
-        # 2. Check if the user is providing an answer to a previous question
-        if request.last_question_id and user_input_upper in ['A', 'B', 'C', 'D']:
-            option = await options_collection.find_one({
-                "question_id": ObjectId(request.last_question_id),
-                "option_no": user_input_upper
-            })
-            if option:
-                await add_answer({
-                    "question_id": ObjectId(request.last_question_id),
-                    "answer_id": option["_id"]
-                })
-                logger.info(f"Answer '{user_input_upper}' stored for question {request.last_question_id}")
-            else:
-                logger.warning(f"Could not find option '{user_input_upper}' for question {request.last_question_id}")
-
-
-        # 3. Handle initial greeting
-        if not request.conversation_history:
-            greeting_response = await generate_greeting(request.language)
-            # Return chat_history_id with the first response
-            return {"response": greeting_response, "chat_history_id": chat_history_id}
-
-        # 4. Agentic logic (intent detection and flow handling)
-        current_flow = get_current_flow(request.conversation_history)
-        question_count = count_questions_asked(request.conversation_history)
-        conv_context = get_conversation_context(request.conversation_history)
-        intent = await detect_user_intent(request.user_input, request.language, conv_context)
-        print(f"Detected intent: {intent}")
-
-        # --- The rest of your agentic flow logic remains the same ---
-        # Note: The agent calls will now return a dict with more data
-        
-        if intent == "SWITCH_TO_APPOINTMENT":
-            update_flow_marker(request.conversation_history, "appointment")
-            return await handle_enhanced_appointment_flow_with_confirmation(request) # Modify this agent if it needs to return IDs
-
-        if current_flow == "diagnosis" or intent == "DIAGNOSIS":
-            if question_count >= 5 and intent == "APPOINTMENT":
-                update_flow_marker(request.conversation_history, "appointment")
-                return await handle_enhanced_appointment_flow_with_confirmation(request)
+
+        # 2. Server-side session: clients may send only the new message
+        stored_session = await session_store.get(chat_history_id)
+        if not is_new_chat and stored_session is None and not request.conversation_history:
+            # The session expired or was evicted: don't restart the chat with a greeting,
+            # ask the client to resend the full history instead
+            logger.warning(f"No server-side session for chat {chat_history_id}; asking client for full history")
+            raise HTTPException(409, "Chat session expired; resend the request with the full conversation_history")
+        session = stored_session or Session(chat_history_id)
+        server_side_history = not request.conversation_history and bool(session.history)
+        if server_side_history:
+            user_message = {"role": "user", "content": request.user_input}
+            request.conversation_history = session.history + [user_message]
+            # Extend the cached state with the new message instead of re-scanning
+            if session.state is not None and session.state.tracks(session.history):
+                state = session.state.advance(request.conversation_history, [user_message])
             else:
-                # This call now returns the full payload
-                return await handle_diagnosis_flow(request, question_count)
+                state = ConversationState.from_history(request.conversation_history)
+        else:
+            state = ConversationState.from_history(request.conversation_history)
+        if not request.last_question_id:
+            request.last_question_id = session.last_question_id
+
+        with track_conversation(state), llm_session(chat_history_id):
+            if server_side_history:
+                add_flow_marker_from_input(request.conversation_history, request.user_input)
 
-        elif current_flow == "appointment" or intent == "APPOINTMENT":
-             return await handle_enhanced_appointment_flow_with_confirmation(request)
-        
-        else:  # UNCLEAR intent
-            clarification_response = await generate_clarification(request.user_input, request.language)
-            return {"response": clarification_response, "chat_history_id": chat_history_id}
+            # 3. Check if the user is providing an answer to a previous question
+            if request.last_question_id and user_input_upper in ['A', 'B', 'C', 'D']:
+                question_id = ObjectId(request.last_question_id)
+                option_id = option_cache.get(chat_history_id, question_id, user_input_upper)
+                if option_id is None:
+                    # Not written by this process (or evicted): fall back to Mongo, after
+                    # this question's queued write (if any) has landed
+                    await write_queue.wait_for(str(question_id))
+                    option = await find_option(question_id, user_input_upper)
+                    option_id = option["_id"] if option else None
+                if option_id is not None:
+                    await add_answer({
+                        "question_id": question_id,
+                        "answer_id": option_id
+                    })
+                    logger.info(f"Answer '{user_input_upper}' stored for question {request.last_question_id}")
+                else:
+                    logger.warning(f"Could not find option '{user_input_upper}' for question {request.last_question_id}")
 
+
+            # 4. Handle initial greeting
+            if not request.conversation_history:
+                greeting_response = await generate_greeting(request.language)
+                session.history = [{"role": "assistant", "content": greeting_response}]
+                session.state = ConversationState.from_history(session.history)
+                session.last_question_id = None
+                await session_store.save(session)
+                # Return chat_history_id with the first response
+                return {"response": greeting_response, "chat_history_id": chat_history_id}
+
+            # 5. Agentic logic (intent detection and flow handling)
+            result = await route_chat_turn(request, chat_history_id)
+
+            # 6. Keep the updated history (including flow/selection markers) and its state server-side
+            assistant_message = {"role": "assistant", "content": result.get("response", "")}
+            session.history = request.conversation_history + [assistant_message]
+            if state.tracks(request.conversation_history):
+                session.state = state.advance(session.history, [assistant_message])
+            else:
+                session.state = ConversationState.from_history(session.history)
+            session.last_question_id = result.get("question_id")
+            await session_store.save(session)
+            return result
+
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_overload_error(e):
+            logger.warning("Chat turn rejected by the LLM gateway")
+            raise HTTPException(503, "Chat service busy, please retry")
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(500, "Chat processing failed")
 
+def choose_route(intent: str, current_flow: str, question_count: int) -> str:
+    """Which handler a turn goes to, given the detected intent"""
+    if intent == "SWITCH_TO_APPOINTMENT":
+        return "switch_to_appointment"
+    if current_flow == "diagnosis" or intent == "DIAGNOSIS":
+        if question_count >= 5 and intent == "APPOINTMENT":
+            return "switch_to_appointment"
+        return "diagnosis"
+    if current_flow == "appointment" or intent == "APPOINTMENT":
+        return "appointment"
+    return "clarification"
+
+async def start_speculative_diagnosis(request: ChatRequest, question_count: int):
+    """Start the diagnosis generation before intent detection finishes.
+
+    Tokens are held back in a DeferredSink until the route is confirmed.
+    """
+    real_sink = current_token_sink()
+    deferred = DeferredSink() if real_sink is not None else None
+
+    async def generate():
+        if deferred is None:
+            return await generate_diagnosis_response(request, question_count)
+        with stream_tokens_to(deferred):
+            return await generate_diagnosis_response(request, question_count)
+
+    return asyncio.create_task(generate()), deferred, real_sink
+
+async def route_chat_turn(request: ChatRequest, chat_history_id: str) -> dict:
+    current_flow = get_current_flow(request.conversation_history)
+    question_count = count_questions_asked(request.conversation_history)
+    conv_context = get_conversation_context(request.conversation_history)
+
+    # Speculation: in an active diagnosis flow the intent rarely changes the route, so
+    # start the question generation now instead of after detect_user_intent returns.
+    # Only the LLM call is speculated; the appointment flow writes markers and
+    # bookings, so it always waits for the route.
+    speculative = None
+    if SPECULATIVE_ROUTING and llm_gateway.has_capacity():
+        # No need to speculate when the question bank will answer without the LLM
+        if current_flow == "diagnosis" and find_bank_question(request, question_count, record=False) is None:
+            speculative = await start_speculative_diagnosis(request, question_count)
+
+    try:
+        intent = await detect_user_intent(request.user_input, request.language, conv_context, current_flow)
+    except BaseException:
+        if speculative is not None:
+            speculative[0].cancel()
+        raise
+    print(f"Detected intent: {intent}")
+    route = choose_route(intent, current_flow, question_count)
+
+    if speculative is not None:
+        task, deferred, real_sink = speculative
+        if route == "diagnosis":
+            speculation_stats["hits"] += 1
+            if deferred is not None:
+                deferred.release(real_sink)
+            return await handle_diagnosis_flow(request, question_count, llm_response=await task)
+        speculation_stats["wasted"] += 1
+        if task.done():
+            speculation_stats["wasted_completed"] += 1
+            if not task.cancelled():
+                task.exception()  # mark a failed speculation's error as retrieved
+        task.cancel()
+        if deferred is not None:
+            deferred.discard()
+
+    # --- The rest of your agentic flow logic remains the same ---
+    # Note: The agent calls will now return a dict with more data
+    
+    if route == "switch_to_appointment":
+        update_flow_marker(request.conversation_history, "appointment")
+        return await handle_enhanced_appointment_flow_with_confirmation(request) # Modify this agent if it needs to return IDs
+
+    if route == "diagnosis":
+        # This call now returns the full payload
+        return await handle_diagnosis_flow(request, question_count)
+
+    elif route == "appointment":
+         return await handle_enhanced_appointment_flow_with_confirmation(request)
+    
+    else:  # UNCLEAR intent
+        clarification_response = await generate_clarification(request.user_input, request.language)
+        return {"response": clarification_response, "chat_history_id": chat_history_id}
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same turn as /chat, delivered as Server-Sent Events.
+
+    `token` events carry generated text as it arrives; the final `done` event
+    carries the payload /chat would have returned (after question parsing and
+    persistence have finished).
+    """
+    print("Function: chat_stream")
+    queue = asyncio.Queue()
+
+    async def run_turn():
+        with stream_tokens_to(queue):
+            return await chat(request)
+
+    # The turn runs to completion even if the client disconnects mid-stream
+    turn = asyncio.create_task(run_turn())
+
+    async def event_stream():
+        while True:
+            next_token = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({next_token, turn}, return_when=asyncio.FIRST_COMPLETED)
+            if next_token in done:
+                yield format_sse("token", {"token": next_token.result()})
+                continue
+            next_token.cancel()
+            while not queue.empty():
+                yield format_sse("token", {"token": queue.get_nowait()})
+            try:
+                yield format_sse("done", turn.result())
+            except HTTPException as e:
+                yield format_sse("error", {"detail": e.detail, "status": e.status_code})
+            except Exception as e:
+                logger.error(f"Chat stream error: {str(e)}")
+                yield format_sse("error", {"detail": "Chat processing failed"})
+            break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/suggest_department")
 async def suggest_department_endpoint(request: HistoryRequest):
     logger.info(f"Received /suggest_department request for language: {request.language}")
-    suggested_dept = await suggest_department(request.conversation_history, request.language)
-    return {"suggested_department": suggested_dept}
+    suggested_dept = await suggest_department(request)
+    return {"suggested_department": suggested_dept["department"]}
 
 @app.post("/generate_report")
-async def generate_consultation_report(request: HistoryRequest):
+async def generate_consultation_report(request: HistoryRequest, if_none_match: Optional[str] = Header(None)):
     logger.info("Received /generate_report request")
-    # For report generation, you might need to infer department or pass it from client if available
-    # For now, let's pass a placeholder or try to infer from history if possible within generate_report func.
-    # The current `generate_report` function expects 'department' as an arg, so passing 'N/A' or inferring from history if available.
-    # In a real app, you might have a dedicated step to confirm this.
-    inferred_department = "N/A" # Placeholder, update if you have logic to infer from history
-    for msg in reversed(request.conversation_history):
-        if "department" in msg.get("content", "").lower():
-            match = re.search(r"department:\s*([a-zA-Z\s]+)", msg["content"], re.IGNORECASE)
-            if match:
-                inferred_department = match.group(1).strip()
-                break
-
-    return await generate_report(
-        name=request.name,
-        gender=request.gender,
-        age=request.age,
-        language=request.language,
-        conversation_history=request.conversation_history,
-        department=inferred_department
-    )
+    return await generate_report(request, if_none_match)
 
 @app.post("/generate_offline_report")
 async def generate_offline_report_endpoint(request: OfflineReportRequest):
     logger.info("Received /generate_offline_report request")
-    return await generate_offline_report(
-        name=request.name,
-        age=request.age,
-        gender=request.gender,
-        department=request.department,
-        language=request.language,
-        responses=request.responses
-    )
\ No newline at end of file
+    return await generate_offline_report(request)
+
+def submit_report_job(kind: str, request) -> dict:
+    try:
+        job = report_jobs.submit(kind, request)
+    except ReportQueueFullError:
+        raise HTTPException(503, "Report service busy, please retry")
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.post("/reports/consultation")
+async def submit_consultation_report(request: HistoryRequest):
+    logger.info("Received /reports/consultation request")
+    return submit_report_job("consultation", request)
+
+@app.post("/reports/offline")
+async def submit_offline_report(request: OfflineReportRequest):
+    logger.info("Received /reports/offline request")
+    return submit_report_job("offline", request)
+
+@app.get("/reports/artifacts/{report_key}")
+async def cached_report_artifact(report_key: str, if_none_match: Optional[str] = Header(None)):
+    artifact = report_cache.get(report_key)
+    if not artifact:
+        raise HTTPException(404, "Report not cached")
+    if etag_matches(if_none_match, report_key):
+        return Response(status_code=304, headers={"ETag": artifact.etag})
+    return Response(
+        content=artifact.pdf,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": "attachment; filename=medical_report.pdf",
+            "ETag": artifact.etag,
+            "Cache-Control": "private, no-cache",
+        }
+    )
+
+@app.get("/reports/{job_id}")
+async def report_job_status(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Report job not found")
+    return job.describe()
+
+@app.get("/reports/{job_id}/result")
+async def report_job_result(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Report job not found")
+    if job.status == "failed":
+        raise HTTPException(500, "Report generation failed")
+    if job.status != "done":
+        # Still queued or running: tell the client to poll again
+        return JSONResponse(status_code=202, content=job.describe())
+    filename = "medical_report.pdf" if job.media_type == "application/pdf" else "offline_report.json"
+    return FileResponse(job.result_path, media_type=job.media_type, filename=filename)
+
+@app.post("/doctors/availability")
+async def batch_doctor_availability(request: BatchAvailabilityRequest):
+    logger.info(f"Received /doctors/availability request for {len(request.doctor_ids)} doctors")
+    doctors = await get_doctors_by_ids(request.doctor_ids)
+    calendars = await get_doctors_available_slots(list(doctors), request.days_ahead, doctors=doctors)
+
+    results = []
+    for doctor_id in request.doctor_ids:
+        doctor = doctors.get(doctor_id)
+        if not doctor:
+            continue
+        available_slots = calendars.get(doctor_id, [])
+        entry = {
+            "doctor_id": doctor_id,
+            "name": doctor.get("name"),
+            "department": doctor.get("department"),
+            "next_available": first_free_slot(available_slots)
+        }
+        if request.include_slots:
+            entry["available_slots"] = available_slots
+        results.append(entry)
+    return {"doctors": results}
@@ -1,3 +1,4 @@
+import asyncio
 import motor.motor_asyncio
 from bson.objectid import ObjectId
 import time
@@ -15,6 +16,20 @@ question_collection = database["question"]
 options_collection = database["options"]
 answer_collection = database["answer"]
 
+# Indexes every deployment needs: collection -> [(name, keys)]
+# Names are MongoDB's defaults so indexes created earlier without a name are
+# recognised as the same index instead of raising IndexOptionsConflict
+# find_option on embedded options is served by question._id; the options index
+# only backs its fallback for questions stored before options were embedded
+INDEX_SPECS = {
+    "options": [("question_id_1_option_no_1", [("question_id", 1), ("option_no", 1)])],
+    "question": [("chat_history_id_1_question_no_1", [("chat_history_id", 1), ("question_no", 1)])],
+    "answer": [("question_id_1", [("question_id", 1)])],
+}
+
+# Result of the last ensure_indexes() run, served by /stats/indexes
+index_status = {}
+
 async def connect_db():
     try:
         await client.admin.command('ping')
@@ -22,6 +37,40 @@ async def connect_db():
     except Exception as e:
         print(f"Could not connect to MongoDB: {e}")
 
+async def _ensure_index(collection_name: str, name: str, keys: list):
+    started = time.perf_counter()
+    try:
+        await database[collection_name].create_index(keys, name=name)
+        status = "ready"
+        error = None
+    except Exception as e:
+        status = "failed"
+        error = str(e)
+    return {
+        "collection": collection_name,
+        "name": name,
+        "keys": [field for field, _ in keys],
+        "status": status,
+        "error": error,
+        "build_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+async def ensure_indexes():
+    # create_index is a no-op for indexes that already exist, so this is safe on every startup
+    results = await asyncio.gather(*(
+        _ensure_index(collection_name, name, keys)
+        for collection_name, specs in INDEX_SPECS.items()
+        for name, keys in specs
+    ))
+    index_status.clear()
+    for result in results:
+        index_status[f"{result['collection']}.{result['name']}"] = result
+        if result["status"] == "ready":
+            print(f"Index {result['collection']}.{result['name']} ready ({result['build_ms']} ms)")
+        else:
+            print(f"Could not create index {result['collection']}.{result['name']}: {result['error']}")
+    return index_status
+
 async def close_db():
     client.close()
     print("MongoDB connection closed")
@@ -39,6 +88,81 @@ async def add_option(option_data: dict):
     new_option = await options_collection.insert_one(option_data)
     return new_option.inserted_id
 
+def build_question_documents(question_data: dict, options: list):
+    """Question and option documents with client-side ObjectIds.
+
+    Ids are assigned up front so callers know the question_id (and each
+    option's _id) before the documents reach MongoDB.
+    """
+    question_doc = {"_id": ObjectId(), **question_data}
+    option_docs = [
+        {"_id": ObjectId(), "question_id": question_doc["_id"], **option}
+        for option in options
+    ]
+    return question_doc, option_docs
+
+def embed_options(question_doc: dict, option_docs: list) -> dict:
+    """Stored form of a question: its options embedded, without their question_id back-reference"""
+    embedded = [
+        {key: value for key, value in option.items() if key != "question_id"}
+        for option in option_docs
+    ]
+    return {**question_doc, "options": embedded}
+
+def embedded_option_query(question_id: ObjectId, option_no: str):
+    """(filter, projection) finding one embedded option; served by the _id index"""
+    return {"_id": question_id, "options.option_no": option_no}, {"options.$": 1}
+
+async def add_question_with_options(question_doc: dict, option_docs: list):
+    # Options are embedded in the question document so the whole question is one insert
+    await question_collection.insert_one(embed_options(question_doc, option_docs))
+    return question_doc["_id"]
+
+async def find_option(question_id: ObjectId, option_no: str):
+    question = await question_collection.find_one(*embedded_option_query(question_id, option_no))
+    if question and question.get("options"):
+        return {"_id": question["options"][0]["_id"]}
+    # Questions written before options were embedded keep them in their own collection
+    return await options_collection.find_one(
+        {"question_id": question_id, "option_no": option_no},
+        {"_id": 1}
+    )
+
+async def get_recent_questions_with_options(limit: int):
+    # Newest questions with their options and the chat's department/language
+    pipeline = [
+        {"$sort": {"_id": -1}},
+        {"$limit": limit},
+        {"$lookup": {"from": "options", "localField": "_id", "foreignField": "question_id", "as": "legacy_options"}},
+        {"$addFields": {"options": {"$ifNull": ["$options", "$legacy_options"]}}},
+        {"$lookup": {"from": "chat_history", "localField": "chat_history_id", "foreignField": "_id", "as": "chat"}},
+        {"$project": {
+            "question_no": 1,
+            "question_text": 1,
+            "follows": 1,
+            "options.option_no": 1,
+            "options.option_text": 1,
+            "options.ehr_terminology": 1,
+            "chat.reason_for_visit": 1,
+            "chat.language": 1,
+        }},
+    ]
+    return await question_collection.aggregate(pipeline).to_list(length=limit)
+
 async def add_answer(answer_data: dict):
     new_answer = await answer_collection.insert_one(answer_data)
-    return new_answer.inserted_id
\ No newline at end of file
+    return new_answer.inserted_id
+
+async def get_session_data(chat_history_id: str):
+    # Server-side conversation state stored on the chat_history record
+    return await chat_history_collection.find_one(
+        {"_id": chat_history_id},
+        {"conversation_history": 1, "last_question_id": 1}
+    )
+
+async def save_session_data(chat_history_id: str, session_data: dict):
+    await chat_history_collection.update_one(
+        {"_id": chat_history_id},
+        {"$set": session_data},
+        upsert=True
+    )
@@ -0,0 +1,60 @@
+import json
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+OPTION_NUMBERS = ["A", "B", "C", "D"]
+
+
+class DiagnosisOption(BaseModel):
+    option_no: str
+    text: str
+    ehr_terminology: str = ""
+
+
+class DiagnosisOutput(BaseModel):
+    # "question" or "recommendation"
+    type: str
+    question: Optional[str] = None
+    options: List[DiagnosisOption] = []
+    message: Optional[str] = None
+
+    def render(self) -> str:
+        """Chat text in the same layout the free-text prompt produced"""
+        if self.type == "recommendation":
+            return self.message
+        lines = [self.question]
+        for option in self.options:
+            ehr = f" ({option.ehr_terminology})" if option.ehr_terminology else ""
+            lines.append(f"{option.option_no}. {option.text}{ehr}")
+        return "\n\n".join(lines)
+
+
+def parse_diagnosis_output(raw: str) -> Optional[DiagnosisOutput]:
+    """Validated DiagnosisOutput from the model's JSON, or None if it does not match the schema"""
+    try:
+        data = json.loads(raw)
+        output = DiagnosisOutput(**data)
+    except (ValueError, TypeError):
+        # json.JSONDecodeError and pydantic's ValidationError are both ValueErrors
+        return None
+
+    output.type = output.type.strip().lower()
+    if output.type == "recommendation":
+        output.message = (output.message or "").strip()
+        return output if output.message else None
+    if output.type != "question":
+        return None
+
+    output.question = (output.question or "").strip()
+    for option in output.options:
+        option.option_no = option.option_no.strip().rstrip(".").upper()
+        option.text = option.text.strip()
+        option.ehr_terminology = option.ehr_terminology.strip().strip("()")
+    if (
+        not output.question
+        or [option.option_no for option in output.options] != OPTION_NUMBERS
+        or not all(option.text for option in output.options)
+    ):
+        return None
+    return output
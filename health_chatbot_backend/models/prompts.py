@@ -107,6 +107,21 @@ Analyze the message and return ONLY one of these words: DIAGNOSIS, APPOINTMENT,
 
 
 
+CLARIFICATION_PROMPT = """The user said: "{user_input}"
+
+Generate a friendly clarification message in {language} asking whether they want:
+1. Medical diagnosis/health questions
+2. Appointment booking with doctors
+
+Keep it conversational and helpful."""
+
+
+
+
+
+
+
+
 MEDICAL_PROMPT = """You are a professional medical assistant. Based on conversation history and preferred language, generate medical questions to gather information about the patient's condition.
 
 Problem: {department}.
@@ -128,6 +143,28 @@ Return the appropriate response based on question count."""
 
 
 
+MEDICAL_JSON_PROMPT = """You are a professional medical assistant. Based on conversation history and preferred language, generate medical questions to gather information about the patient's condition.
+
+Problem: {department}.
+Current question count: {question_count}
+Total questions asked so far: {question_count}/5
+
+Instructions:
+- If question_count < 5: Generate the next multiple-choice question with exactly 4 options (A, B, C, D) related to the patient's Problem: {department} (e.g., symptoms , medical desease,problem ,pain etc.).
+- Don't repeat previous questions.
+- Each option must include **EHR-specific terminology** in its own field.
+- All question and option text must be in the selected language: {language}
+- **(MUST IMPLEMENT)** If question_count >= 5: Instead of generating more questions, recommend consulting a doctor and suggest booking an appointment. Tell user to type "Book Appointment" or say "Appointment" to START the appointment flow.
+
+Conversation History:
+{conversation_history}
+
+Respond with ONLY a JSON object, no other text, in one of these two shapes:
+{{"type": "question", "question": "<question text>", "options": [{{"option_no": "A", "text": "<option text>", "ehr_terminology": "<EHR term>"}}, {{"option_no": "B", "text": "...", "ehr_terminology": "..."}}, {{"option_no": "C", "text": "...", "ehr_terminology": "..."}}, {{"option_no": "D", "text": "...", "ehr_terminology": "..."}}]}}
+{{"type": "recommendation", "message": "<recommendation to book an appointment>"}}"""
+
+
+
 SMART_APPOINTMENT_PROMPT = """You are an intelligent appointment booking assistant. 
 
 Current conversation:
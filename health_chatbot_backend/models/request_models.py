@@ -3,6 +3,7 @@ from typing import List, Dict, Any, Optional
 
 class ChatRequest(BaseModel):
     user_input: str
+    # Optional once the chat has a chat_history_id: the server keeps the history
     conversation_history: List[Dict[str, str]] = []
     language: str
     department: str
@@ -19,6 +20,7 @@ class HistoryRequest(BaseModel):
     age: int
     language: str
     conversation_history: List[Dict[str, str]]
+    department: Optional[str] = None
 
 class OfflineReportRequest(BaseModel):
     name: str
@@ -46,4 +48,9 @@ class SlotBookingRequest(BaseModel):
     language: str
     doctor_id: int
     selected_date: str = None
-    selected_time: str = None
\ No newline at end of file
+    selected_time: str = None
+
+class BatchAvailabilityRequest(BaseModel):
+    doctor_ids: List[int]
+    days_ahead: int = 7
+    include_slots: bool = False
@@ -1,40 +1,31 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import os
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
+from services.db_pool import db_pool
+from services.doctor_directory import doctor_directory
+from services.slot_engine import compute_available_slots, first_free_slot
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    print("Function: get_db_connection")
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST", "localhost"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME", "chatbot"),
-            port=int(os.getenv("DB_PORT", "5432"))
-        )
-        logger.info("Database connection successful!")
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Database connection failed: {e}")
-        return None
-
 async def location_based_doctor_search(city: str = None, department: str = None, doctor_name: str = None) -> list:
     """Enhanced doctor search with location and multiple criteria"""
     print("Function: location_based_doctor_search")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
+        # Served from the in-memory directory; SQL below is the fallback
+        await doctor_directory.ensure_fresh()
+        return doctor_directory.search(city=city, department=department, doctor_name=doctor_name)
+    except Exception as e:
+        logger.warning(f"Doctor directory unavailable, querying database: {str(e)}")
+    
+    try:
         # Build dynamic query based on available parameters
         query_parts = []
         params = []
@@ -59,14 +50,8 @@ async def location_based_doctor_search(city: str = None, department: str = None,
         print(f"Query: {base_query}")
         print(f"Params: {params}")
         
-        cursor.execute(base_query, params)
-        doctors_list = cursor.fetchall() or []
-        
-        # Convert RealDictRow to regular dict for consistency
-        doctors_list = [dict(doctor) for doctor in doctors_list]
-        
-        cursor.close()
-        conn.close()
+        # Rows come back as plain dicts from the pool helper
+        doctors_list = await db_pool.fetch_all(base_query, params)
         
         return doctors_list
         
@@ -80,19 +65,17 @@ async def get_doctor_by_id(doctor_id: int) -> dict:
     print(f"Function: get_doctor_by_id - ID: {doctor_id}")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = "SELECT * FROM doctors WHERE id = %s"
-        cursor.execute(query, (doctor_id,))
-        doctor = cursor.fetchone()
-        
-        # Convert RealDictRow to regular dict if found
+        await doctor_directory.ensure_fresh()
+        doctor = doctor_directory.get(doctor_id)
         if doctor:
-            doctor = dict(doctor)
-        
-        cursor.close()
-        conn.close()
+            return doctor
+    except Exception as e:
+        logger.warning(f"Doctor directory unavailable, querying database: {str(e)}")
+    
+    try:
+        # Directory miss (e.g. doctor added since the last refresh)
+        query = "SELECT * FROM doctors WHERE id = %s"
+        doctor = await db_pool.fetch_one(query, (doctor_id,))
         
         return doctor
         
@@ -184,125 +167,16 @@ def parse_doctor_timings(timings_str: str) -> list:
     return working_hours
 
 
-def generate_available_slots(doctor: dict, busy_slots: list, days_ahead: int = 7) -> list:
+def generate_available_slots(doctor: dict, busy_slots: list, days_ahead: int = 7, slot_minutes: int = None) -> list:
     """Generate available time slots using doctor's actual timings from database"""
     print(f"Function: generate_available_slots - Doctor: {doctor['name']}")
     
-    from datetime import datetime, timedelta, time
-    
     # Parse doctor's actual timings from database
     doctor_timings = doctor.get('timings', '')
     working_hours = parse_doctor_timings(doctor_timings)
     
-    print(f"Doctor {doctor['name']} working hours: {working_hours}")
-    
-    available_slots = []
-    
-    # Generate slots for next days (excluding Sundays)
-    for day in range(1, days_ahead + 1):
-        current_date = datetime.now() + timedelta(days=day)
-        
-        # Skip Sundays (weekday 6) - you can customize this
-        if current_date.weekday() == 6:
-            continue
-            
-        date_str = current_date.strftime('%Y-%m-%d')
-        day_name = current_date.strftime('%A')
-        formatted_date = current_date.strftime('%B %d, %Y')
-        
-        # Get busy slots for this date
-        day_busy_slots = []
-        for slot in busy_slots:
-            # Handle both datetime and string date formats
-            slot_date = slot['date']
-            if hasattr(slot_date, 'strftime'):
-                slot_date_str = slot_date.strftime('%Y-%m-%d')
-            else:
-                slot_date_str = str(slot_date)
-                
-            if slot_date_str == date_str:
-                day_busy_slots.append(slot)
-        
-        print(f"Date {date_str}: Found {len(day_busy_slots)} busy slots")
-        
-        # Generate slots based on doctor's actual working hours
-        day_slots = []
-        for start_time_str, end_time_str in working_hours:
-            try:
-                start_time = datetime.strptime(start_time_str, '%H:%M').time()
-                end_time = datetime.strptime(end_time_str, '%H:%M').time()
-                
-                # Generate hourly slots within working hours
-                current_hour = start_time
-                while current_hour < end_time:
-                    # Create 1-hour slot
-                    next_hour_dt = datetime.combine(datetime.today(), current_hour) + timedelta(hours=1)
-                    next_hour = next_hour_dt.time()
-                    
-                    # Don't exceed the working end time
-                    if next_hour > end_time:
-                        next_hour = end_time
-                    
-                    # Check if this slot is busy
-                    is_busy = False
-                    for busy_slot in day_busy_slots:
-                        busy_start = busy_slot['start_time']
-                        busy_end = busy_slot['end_time']
-                        
-                        # Handle different time formats
-                        if isinstance(busy_start, str):
-                            try:
-                                busy_start = datetime.strptime(busy_start, '%H:%M:%S').time()
-                            except:
-                                busy_start = datetime.strptime(busy_start, '%H:%M').time()
-                        elif hasattr(busy_start, 'time'):
-                            busy_start = busy_start.time()
-                            
-                        if isinstance(busy_end, str):
-                            try:
-                                busy_end = datetime.strptime(busy_end, '%H:%M:%S').time()
-                            except:
-                                busy_end = datetime.strptime(busy_end, '%H:%M').time()
-                        elif hasattr(busy_end, 'time'):
-                            busy_end = busy_end.time()
-                        
-                        # Check for overlap
-                        if (current_hour >= busy_start and current_hour < busy_end) or \
-                           (next_hour > busy_start and next_hour <= busy_end) or \
-                           (current_hour <= busy_start and next_hour >= busy_end):
-                            is_busy = True
-                            break
-                    
-                    if not is_busy:
-                        day_slots.append({
-                            'time': current_hour.strftime('%I:%M %p'),
-                            'end_time': next_hour.strftime('%I:%M %p'),
-                            'start_24h': current_hour.strftime('%H:%M'),
-                            'end_24h': next_hour.strftime('%H:%M')
-                        })
-                        print(f"Available slot: {current_hour.strftime('%I:%M %p')} - {next_hour.strftime('%I:%M %p')}")
-                    else:
-                        print(f"Busy slot: {current_hour.strftime('%I:%M %p')} - {next_hour.strftime('%I:%M %p')}")
-                    
-                    # Move to next hour
-                    current_hour = next_hour
-                    
-                    # Break if we've reached the end time
-                    if current_hour >= end_time:
-                        break
-                        
-            except Exception as e:
-                print(f"Error processing working hours {start_time_str}-{end_time_str}: {str(e)}")
-                continue
-        
-        if day_slots:
-            available_slots.append({
-                'date': date_str,
-                'formatted_date': formatted_date,
-                'day_name': day_name,
-                'slots': day_slots
-            })
-            print(f"Added {len(day_slots)} available slots for {formatted_date}")
+    # Busy intervals are parsed once and swept against the working windows
+    available_slots = compute_available_slots(working_hours, busy_slots, days_ahead, slot_minutes)
     
     print(f"Total available slot days: {len(available_slots)}")
     return available_slots
@@ -313,9 +187,6 @@ async def get_doctor_available_slots(doctor_id: int, days_ahead: int = 7) -> lis
     print(f"Function: get_doctor_available_slots - Doctor ID: {doctor_id}")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
         # Get doctor's general timings
         doctor = await get_doctor_by_id(doctor_id)
         if not doctor:
@@ -336,14 +207,8 @@ async def get_doctor_available_slots(doctor_id: int, days_ahead: int = 7) -> lis
         ORDER BY date, start_time
         """
         
-        cursor.execute(query, (doctor_id, end_date.strftime('%Y-%m-%d')))
-        busy_slots = cursor.fetchall() or []
+        busy_slots = await db_pool.fetch_all(query, (doctor_id, end_date.strftime('%Y-%m-%d')))
         print(f"Found {len(busy_slots)} busy slots for doctor ID {doctor_id}")
-        # Convert RealDictRow to regular dict
-        busy_slots = [dict(slot) for slot in busy_slots]
-        
-        cursor.close()
-        conn.close()
         
         # Generate available slots (this is a simplified version)
         # You can customize this logic based on your business requirements
@@ -354,6 +219,90 @@ async def get_doctor_available_slots(doctor_id: int, days_ahead: int = 7) -> lis
     except Exception as e:
         logger.error(f"Get available slots error: {str(e)}")
         return []
+
+
+async def get_doctors_by_ids(doctor_ids: List[int]) -> Dict[int, dict]:
+    """Get several doctors at once, keyed by ID"""
+    print(f"Function: get_doctors_by_ids - IDs: {doctor_ids}")
+    
+    doctors = {}
+    try:
+        await doctor_directory.ensure_fresh()
+        for doctor_id in doctor_ids:
+            doctor = doctor_directory.get(doctor_id)
+            if doctor:
+                doctors[doctor_id] = doctor
+    except Exception as e:
+        logger.warning(f"Doctor directory unavailable, querying database: {str(e)}")
+    
+    missing = [doctor_id for doctor_id in doctor_ids if doctor_id not in doctors]
+    if missing:
+        try:
+            rows = await db_pool.fetch_all("SELECT * FROM doctors WHERE id = ANY(%s)", (missing,))
+            doctors.update({row['id']: row for row in rows})
+        except Exception as e:
+            logger.error(f"Get doctors by IDs error: {str(e)}")
+    
+    return doctors
+
+
+async def get_doctors_available_slots(doctor_ids: List[int], days_ahead: int = 7,
+                                      doctors: Optional[Dict[int, dict]] = None) -> Dict[int, list]:
+    """Get available time slots for many doctors with a single slot query.
+
+    Callers that already fetched the doctor rows pass them as `doctors` to skip the lookup.
+    """
+    print(f"Function: get_doctors_available_slots - Doctor IDs: {doctor_ids}")
+    
+    try:
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        if doctors is None:
+            doctors = await get_doctors_by_ids(doctor_ids)
+        else:
+            doctors = {doctor_id: doctors[doctor_id] for doctor_id in doctor_ids if doctor_id in doctors}
+        if not doctors:
+            return {}
+        
+        end_date = datetime.now() + timedelta(days=days_ahead)
+        
+        query = """
+        SELECT doctor_id, date, start_time, end_time, status 
+        FROM slot 
+        WHERE doctor_id = ANY(%s) 
+        AND date >= CURRENT_DATE 
+        AND date <= %s 
+        AND status = 'Busy'
+        ORDER BY doctor_id, date, start_time
+        """
+        
+        busy_rows = await db_pool.fetch_all(query, (list(doctors), end_date.strftime('%Y-%m-%d')))
+        print(f"Found {len(busy_rows)} busy slots for {len(doctors)} doctors")
+        
+        # Split busy rows per doctor in one pass
+        busy_by_doctor = {doctor_id: [] for doctor_id in doctors}
+        for row in busy_rows:
+            busy_by_doctor.setdefault(row['doctor_id'], []).append(row)
+        
+        return {
+            doctor_id: compute_available_slots(
+                parse_doctor_timings(doctor.get('timings', '')),
+                busy_by_doctor[doctor_id],
+                days_ahead
+            )
+            for doctor_id, doctor in doctors.items()
+        }
+        
+    except Exception as e:
+        logger.error(f"Get batch available slots error: {str(e)}")
+        return {}
+
+
+async def get_next_free_slots(doctor_ids: List[int], days_ahead: int = 7) -> Dict[int, Optional[dict]]:
+    """Earliest free slot per doctor (None when fully booked in the window)"""
+    print(f"Function: get_next_free_slots - Doctor IDs: {doctor_ids}")
+    
+    calendars = await get_doctors_available_slots(doctor_ids, days_ahead)
+    return {doctor_id: first_free_slot(available_slots) for doctor_id, available_slots in calendars.items()}
     
 
 
@@ -377,12 +326,6 @@ async def store_appointment_in_database(doctor: dict, selected_slot: dict, patie
     print("Function: store_appointment_in_database")
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            raise Exception("Database connection failed")
-        
-        cursor = conn.cursor()
-        
         # Prepare appointment data
         doctor_name = doctor.get('name', 'Unknown Doctor')
         
@@ -396,70 +339,67 @@ async def store_appointment_in_database(doctor: dict, selected_slot: dict, patie
         time_slot = selected_slot['start_24h']  # 24-hour format like "10:30"
         booking_date = datetime.now()
         
-        # First, let's check if the table has auto-increment ID or we need to generate one
-        try:
-            # Try with RETURNING id (works if id is SERIAL/auto-increment)
-            insert_query = """
-            INSERT INTO appointments (
-                doctor_name, patient_name, patient_age, patient_gender, 
-                time_slot, reason_for_visit, booking_date
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
-            """
-            
-            cursor.execute(insert_query, (
-                doctor_name,
-                patient_name,
-                patient_age,
-                patient_gender,
-                time_slot,
-                reason_for_visit,
-                booking_date
-            ))
-            
-            # Get the generated appointment ID
-            result = cursor.fetchone()
-            appointment_id = result[0] if result else None
-            
-        except Exception as e:
-            print(f"RETURNING id failed, trying alternative approach: {str(e)}")
-            
-            # If RETURNING doesn't work, get the max ID and increment
-            cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM appointments")
-            next_id = cursor.fetchone()[0]
-            
-            # Insert with explicit ID
-            insert_query = """
-            INSERT INTO appointments (
-                id, doctor_name, patient_name, patient_age, patient_gender, 
-                time_slot, reason_for_visit, booking_date
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            cursor.execute(insert_query, (
-                next_id,
-                doctor_name,
-                patient_name,
-                patient_age,
-                patient_gender,
-                time_slot,
-                reason_for_visit,
-                booking_date
-            ))
-            
-            appointment_id = next_id
+        values = (
+            doctor_name,
+            patient_name,
+            patient_age,
+            patient_gender,
+            time_slot,
+            reason_for_visit,
+            booking_date
+        )
+        
+        # Runs in a pool worker thread; committed by db_pool.run
+        def _insert_appointment(conn):
+            cursor = conn.cursor()
+            try:
+                # First, let's check if the table has auto-increment ID or we need to generate one
+                try:
+                    # Try with RETURNING id (works if id is SERIAL/auto-increment)
+                    insert_query = """
+                    INSERT INTO appointments (
+                        doctor_name, patient_name, patient_age, patient_gender, 
+                        time_slot, reason_for_visit, booking_date
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id;
+                    """
+                    
+                    cursor.execute(insert_query, values)
+                    
+                    # Get the generated appointment ID
+                    result = cursor.fetchone()
+                    return result[0] if result else None
+                    
+                except psycopg2.Error as e:
+                    print(f"RETURNING id failed, trying alternative approach: {str(e)}")
+                    # The failed statement aborted the transaction
+                    conn.rollback()
+                    
+                    # If RETURNING doesn't work, get the max ID and increment
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM appointments")
+                    next_id = cursor.fetchone()[0]
+                    
+                    # Insert with explicit ID
+                    insert_query = """
+                    INSERT INTO appointments (
+                        id, doctor_name, patient_name, patient_age, patient_gender, 
+                        time_slot, reason_for_visit, booking_date
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """
+                    
+                    cursor.execute(insert_query, (next_id,) + values)
+                    
+                    return next_id
+            finally:
+                cursor.close()
         
-        # Commit the transaction
-        conn.commit()
+        appointment_id = await db_pool.run(_insert_appointment)
         
         # Also update the slot table to mark this time as busy
         doctor_id = doctor.get('id')
         if doctor_id:
             await mark_slot_as_busy(doctor_id, selected_slot['date'], selected_slot['start_24h'], selected_slot['end_24h'])
         
-        cursor.close()
-        conn.close()
-        
         print(f"Appointment stored successfully with ID: {appointment_id}")
         
         return {
@@ -481,39 +421,38 @@ async def mark_slot_as_busy(doctor_id: int, date: str, start_time: str, end_time
     print(f"Function: mark_slot_as_busy - Doctor: {doctor_id}, Date: {date}, Time: {start_time}-{end_time}")
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-        
-        cursor = conn.cursor()
-        
-        # Check if slot entry already exists
-        check_query = """
-        SELECT id FROM slot 
-        WHERE doctor_id = %s AND date = %s AND start_time = %s AND end_time = %s
-        """
-        
-        cursor.execute(check_query, (doctor_id, date, start_time, end_time))
-        existing_slot = cursor.fetchone()
-        
-        if existing_slot:
-            # Update existing slot to busy
-            update_query = """
-            UPDATE slot SET status = 'Busy' 
-            WHERE doctor_id = %s AND date = %s AND start_time = %s AND end_time = %s
-            """
-            cursor.execute(update_query, (doctor_id, date, start_time, end_time))
-        else:
-            # Insert new busy slot
-            insert_query = """
-            INSERT INTO slot (doctor_id, date, start_time, end_time, status)
-            VALUES (%s, %s, %s, %s, 'Busy')
-            """
-            cursor.execute(insert_query, (doctor_id, date, start_time, end_time))
+        slot_key = (doctor_id, date, start_time, end_time)
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        def _upsert_busy_slot(conn):
+            cursor = conn.cursor()
+            try:
+                # Check if slot entry already exists
+                check_query = """
+                SELECT id FROM slot 
+                WHERE doctor_id = %s AND date = %s AND start_time = %s AND end_time = %s
+                """
+                
+                cursor.execute(check_query, slot_key)
+                existing_slot = cursor.fetchone()
+                
+                if existing_slot:
+                    # Update existing slot to busy
+                    update_query = """
+                    UPDATE slot SET status = 'Busy' 
+                    WHERE doctor_id = %s AND date = %s AND start_time = %s AND end_time = %s
+                    """
+                    cursor.execute(update_query, slot_key)
+                else:
+                    # Insert new busy slot
+                    insert_query = """
+                    INSERT INTO slot (doctor_id, date, start_time, end_time, status)
+                    VALUES (%s, %s, %s, %s, 'Busy')
+                    """
+                    cursor.execute(insert_query, slot_key)
+            finally:
+                cursor.close()
+        
+        await db_pool.run(_upsert_busy_slot)
         
         print(f"Slot marked as busy successfully")
         return True
@@ -521,6 +460,3 @@ async def mark_slot_as_busy(doctor_id: int, date: str, start_time: str, end_time
     except Exception as e:
         logger.error(f"Mark slot busy error: {str(e)}")
         return False
-    
-
- 
\ No newline at end of file
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import extensions, pool as pg_pool
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Broken connections replaced per checkout before giving up
+CHECKOUT_ATTEMPTS = 3
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the acquire timeout"""
+
+
+async def _wait_uninterrupted(task: asyncio.Future):
+    """Wait for ``task`` even if the caller is cancelled meanwhile, then re-raise the cancellation.
+
+    Used for worker-thread calls on a pooled connection: the thread cannot be
+    interrupted, so the connection must not be returned to the pool (or
+    leaked) while the thread is still using it.
+    """
+    cancelled = False
+    while not task.done():
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.done():
+                break
+            cancelled = True
+        except Exception:
+            break
+    if cancelled:
+        if not task.cancelled():
+            task.exception()  # retrieved here; the cancellation takes precedence
+        raise asyncio.CancelledError()
+    return task.result()
+
+
+def get_connection_kwargs() -> dict:
+    """Postgres connection parameters read from the environment"""
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD"),
+        "database": os.getenv("DB_NAME", "chatbot"),
+        "port": int(os.getenv("DB_PORT", "5432")),
+    }
+
+
+class AsyncConnectionPool:
+    """Asyncio front-end for a psycopg2 ThreadedConnectionPool.
+
+    Connections are opened once and reused. Every blocking driver call
+    (connect, query, commit) runs in a worker thread so the event loop keeps
+    serving other requests while Postgres answers.
+    """
+
+    def __init__(
+        self,
+        min_size: int = None,
+        max_size: int = None,
+        acquire_timeout: float = None,
+        health_check_interval: float = None,
+    ):
+        self.min_size = int(min_size if min_size is not None else os.getenv("DB_POOL_MIN_SIZE", "2"))
+        self.max_size = int(max_size if max_size is not None else os.getenv("DB_POOL_MAX_SIZE", "20"))
+        self.acquire_timeout = float(
+            acquire_timeout if acquire_timeout is not None else os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10")
+        )
+        # Connections idle for longer than this are pinged with SELECT 1 before reuse
+        self.health_check_interval = float(
+            health_check_interval if health_check_interval is not None
+            else os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")
+        )
+        self._pool: Optional[pg_pool.ThreadedConnectionPool] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._open_lock = asyncio.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._stats = {
+            "acquired_total": 0,
+            "in_use": 0,
+            "waiting": 0,
+            "acquire_timeouts": 0,
+            "health_check_failures": 0,
+            "total_wait_ms": 0.0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self._pool is not None and not self._pool.closed
+
+    async def open(self):
+        """Create the underlying pool (idempotent)"""
+        if self.is_open:
+            return
+        async with self._open_lock:
+            if self.is_open:
+                return
+            self._pool = await asyncio.to_thread(
+                pg_pool.ThreadedConnectionPool,
+                self.min_size,
+                self.max_size,
+                **get_connection_kwargs()
+            )
+            self._semaphore = asyncio.Semaphore(self.max_size)
+            logger.info(f"Postgres pool opened (min={self.min_size}, max={self.max_size})")
+
+    async def close(self):
+        """Close every pooled connection"""
+        if self.is_open:
+            await asyncio.to_thread(self._pool.closeall)
+            self._last_used.clear()
+            logger.info("Postgres pool closed")
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        # Every pooled connection may be stale after a database restart, so keep
+        # validating replacements; give up after a few so a down server fails fast
+        for _ in range(CHECKOUT_ATTEMPTS):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            self._stats["health_check_failures"] += 1
+            logger.warning("Discarding broken pooled Postgres connection")
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError(f"No healthy Postgres connection after {CHECKOUT_ATTEMPTS} attempts")
+
+    def _checkin(self, conn):
+        if conn.closed:
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection for the duration of the ``async with`` block"""
+        await self.open()
+        started = time.perf_counter()
+        self._stats["waiting"] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["acquire_timeouts"] += 1
+            raise PoolTimeoutError(f"No Postgres connection available within {self.acquire_timeout}s")
+        finally:
+            self._stats["waiting"] -= 1
+
+        conn = None
+        try:
+            checkout = asyncio.ensure_future(asyncio.to_thread(self._checkout))
+            try:
+                await _wait_uninterrupted(checkout)
+            finally:
+                # Keep the connection even if we were cancelled, so it is checked back in below
+                if checkout.done() and not checkout.cancelled() and checkout.exception() is None:
+                    conn = checkout.result()
+                    self._stats["acquired_total"] += 1
+                    self._stats["in_use"] += 1
+                    self._stats["total_wait_ms"] += (time.perf_counter() - started) * 1000
+            yield conn
+        finally:
+            try:
+                if conn is not None:
+                    self._stats["in_use"] -= 1
+                    await _wait_uninterrupted(asyncio.ensure_future(asyncio.to_thread(self._checkin, conn)))
+            finally:
+                self._semaphore.release()
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run ``func(conn, *args)`` in a worker thread inside one transaction.
+
+        The transaction is committed when ``func`` returns and rolled back if
+        it raises. If the caller is cancelled mid-query, the connection is
+        only returned to the pool once the worker thread has finished with it.
+        """
+        async with self.connection() as conn:
+            def _call():
+                try:
+                    result = func(conn, *args)
+                    conn.commit()
+                    return result
+                except Exception:
+                    conn.rollback()
+                    raise
+            return await _wait_uninterrupted(asyncio.ensure_future(asyncio.to_thread(_call)))
+
+    async def fetch_all(self, query: str, params=None) -> List[dict]:
+        def _fetch(conn):
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+                return [dict(row) for row in cursor.fetchall() or []]
+        return await self.run(_fetch)
+
+    async def fetch_one(self, query: str, params=None) -> Optional[dict]:
+        def _fetch(conn):
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        return await self.run(_fetch)
+
+    async def execute(self, query: str, params=None) -> int:
+        """Execute a write statement and return the affected row count"""
+        def _execute(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount
+        return await self.run(_execute)
+
+    def stats(self) -> dict:
+        idle = len(getattr(self._pool, "_pool", [])) if self.is_open else 0
+        used = len(getattr(self._pool, "_used", {})) if self.is_open else 0
+        acquired = self._stats["acquired_total"]
+        return {
+            "open": self.is_open,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": idle + used,
+            "idle": idle,
+            "in_use": self._stats["in_use"],
+            "waiting": self._stats["waiting"],
+            "acquired_total": acquired,
+            "acquire_timeouts": self._stats["acquire_timeouts"],
+            "health_check_failures": self._stats["health_check_failures"],
+            "avg_wait_ms": round(self._stats["total_wait_ms"] / acquired, 3) if acquired else 0.0,
+        }
+
+
+# Shared pool used by services/database_service.py
+db_pool = AsyncConnectionPool()
+
+
+async def init_db_pool():
+    try:
+        await db_pool.open()
+        print("Connected to PostgreSQL (pooled)")
+    except Exception as e:
+        print(f"Could not open PostgreSQL pool: {e}")
+
+
+async def close_db_pool():
+    await db_pool.close()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from services.db_pool import db_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _tokens(text: str) -> List[str]:
+    return [token for token in re.split(r"[^a-z0-9]+", (text or "").lower()) if token]
+
+
+def _doctor_location(doctor: dict) -> str:
+    # The column has been read back as both `location` and `Location`
+    return doctor.get("location") or doctor.get("Location") or ""
+
+
+class DoctorDirectory:
+    """In-memory copy of the `doctors` table with hash indexes.
+
+    The roster changes rarely, so the whole table is loaded once and kept for
+    ``ttl`` seconds. Lookups by id, city, department and partial name are then
+    answered from dictionaries instead of Postgres round trips.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = float(ttl if ttl is not None else os.getenv("DOCTOR_CACHE_TTL", "300"))
+        self._by_id: Dict[int, dict] = {}
+        self._by_city: Dict[str, Set[int]] = {}
+        self._by_department: Dict[str, Set[int]] = {}
+        self._by_name_token: Dict[str, Set[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_listeners: List[Callable] = []
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and (time.monotonic() - self._loaded_at) < self.ttl
+
+    def add_refresh_listener(self, callback: Callable):
+        """Register ``callback(directory)`` to run after every successful refresh"""
+        self._refresh_listeners.append(callback)
+
+    def invalidate(self):
+        """Force the next lookup to reload the roster"""
+        self._loaded_at = None
+
+    def load(self, doctors: List[dict]):
+        """Rebuild every index from a list of doctor rows"""
+        by_id, by_city, by_department, by_name_token = {}, {}, {}, {}
+        for doctor in doctors:
+            doctor_id = doctor["id"]
+            by_id[doctor_id] = doctor
+            by_city.setdefault(_doctor_location(doctor).strip().lower(), set()).add(doctor_id)
+            by_department.setdefault((doctor.get("department") or "").strip().lower(), set()).add(doctor_id)
+            for token in _tokens(doctor.get("name")):
+                by_name_token.setdefault(token, set()).add(doctor_id)
+
+        # Swap all indexes at once so readers never see a half-built directory
+        self._by_id, self._by_city = by_id, by_city
+        self._by_department, self._by_name_token = by_department, by_name_token
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self, force: bool = True):
+        """Reload the roster from Postgres"""
+        async with self._refresh_lock:
+            # Concurrent callers that waited on the lock reuse the fresh copy
+            if not force and self.is_fresh:
+                return
+            try:
+                doctors = await db_pool.fetch_all("SELECT * FROM doctors")
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                logger.error(f"Doctor directory refresh error: {str(e)}")
+                raise
+            self.load(doctors)
+            self._stats["refreshes"] += 1
+            logger.info(f"Doctor directory loaded {len(doctors)} doctors")
+
+        for callback in self._refresh_listeners:
+            try:
+                result = callback(self)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Doctor directory refresh listener error: {str(e)}")
+
+    async def ensure_fresh(self):
+        if not self.is_fresh:
+            await self.refresh(force=False)
+
+    def _match_name(self, doctor_name: str) -> Set[int]:
+        query = doctor_name.strip().lower()
+        candidates = None
+        # Each query token must be a substring of some name token
+        for query_token in _tokens(query):
+            matched = set()
+            for token, ids in self._by_name_token.items():
+                if query_token in token:
+                    matched |= ids
+            candidates = matched if candidates is None else candidates & matched
+        if candidates is None:
+            candidates = set(self._by_id)
+        # Same semantics as LOWER(name) LIKE '%query%'
+        return {doctor_id for doctor_id in candidates if query in self._by_id[doctor_id]["name"].lower()}
+
+    def _match_department(self, department: str) -> Set[int]:
+        query = department.strip().lower()
+        matched = set()
+        # Substring match over the (small) set of distinct departments
+        for key, ids in self._by_department.items():
+            if query in key:
+                matched |= ids
+        return matched
+
+    def search(self, city: str = None, department: str = None, doctor_name: str = None) -> List[dict]:
+        """Same filters as location_based_doctor_search, served from memory"""
+        ids = set(self._by_id)
+        if city:
+            ids &= self._by_city.get(city.strip().lower(), set())
+        if doctor_name:
+            ids &= self._match_name(doctor_name)
+        elif department:
+            ids &= self._match_department(department)
+
+        doctors = [dict(self._by_id[doctor_id]) for doctor_id in ids]
+        doctors.sort(key=lambda doc: ((doc.get("department") or "").lower(), (doc.get("name") or "").lower()))
+        return doctors
+
+    def get(self, doctor_id: int) -> Optional[dict]:
+        doctor = self._by_id.get(doctor_id)
+        if doctor is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return dict(doctor)
+
+    def stats(self) -> dict:
+        return {
+            "doctors": len(self._by_id),
+            "cities": len(self._by_city),
+            "departments": len(self._by_department),
+            "name_tokens": len(self._by_name_token),
+            "fresh": self.is_fresh,
+            "ttl": self.ttl,
+            **self._stats,
+        }
+
+
+# Shared directory used by services/database_service.py
+doctor_directory = DoctorDirectory()
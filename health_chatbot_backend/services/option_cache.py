@@ -0,0 +1,59 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+
+class OptionCache:
+    """Options written by the diagnosis flow, kept per chat so answers need no reads.
+
+    Per chat only the most recent questions are kept (the user answers the
+    last one); chats are evicted least-recently-used beyond ``max_sessions``.
+    """
+
+    def __init__(self, max_sessions: int = None, questions_per_session: int = None):
+        self.max_sessions = int(max_sessions if max_sessions is not None else os.getenv("OPTION_CACHE_MAX_SESSIONS", "5000"))
+        self.questions_per_session = int(
+            questions_per_session if questions_per_session is not None
+            else os.getenv("OPTION_CACHE_QUESTIONS_PER_SESSION", "2")
+        )
+        # chat_history_id -> question_id -> option_no -> option _id
+        self._sessions: "OrderedDict[str, OrderedDict[str, Dict[str, ObjectId]]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def remember(self, chat_history_id: str, question_id, option_docs: list):
+        questions = self._sessions.setdefault(chat_history_id, OrderedDict())
+        self._sessions.move_to_end(chat_history_id)
+        questions[str(question_id)] = {doc["option_no"]: doc["_id"] for doc in option_docs}
+        questions.move_to_end(str(question_id))
+        while len(questions) > self.questions_per_session:
+            questions.popitem(last=False)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, chat_history_id: str, question_id, option_no: str) -> Optional[ObjectId]:
+        questions = self._sessions.get(chat_history_id)
+        option_id = questions.get(str(question_id), {}).get(option_no) if questions else None
+        if option_id is None:
+            self._stats["misses"] += 1
+            return None
+        self._sessions.move_to_end(chat_history_id)
+        self._stats["hits"] += 1
+        return option_id
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "questions_per_session": self.questions_per_session,
+            **self._stats,
+        }
+
+
+# Shared instance
+option_cache = OptionCache()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from models.database import get_recent_questions_with_options
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "the", "and", "you", "your", "are", "have", "has", "had", "for", "with", "this", "that", "any",
+    "how", "what", "when", "where", "which", "does", "did", "was", "were", "been", "from", "about",
+    "feel", "feeling", "experience", "experiencing", "please", "help", "need", "can", "not", "very",
+}
+
+
+def keywords(text: str) -> Set[str]:
+    return {
+        token for token in re.split(r"[^\w]+", (text or "").lower())
+        if len(token) >= 3 and token not in STOPWORDS and not token.isdigit()
+    }
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(re.split(r"[^\w]+", (text or "").lower())).strip()
+
+
+AnswerPath = Tuple[str, str]
+
+
+def answer_path(conversation_history: List[Dict[str, str]], user_input: str) -> Optional[AnswerPath]:
+    """(previous question, A-D answer) that the next question follows, or None"""
+    answer = (user_input or "").strip().upper()
+    if answer not in ("A", "B", "C", "D"):
+        return None
+    previous = next((msg for msg in reversed(conversation_history) if msg["role"] == "assistant"), None)
+    if previous is None:
+        return None
+    return normalize_question(previous.get("content", "").strip().split("\n", 1)[0]), answer
+
+
+class BankQuestion:
+    def __init__(self, department: str, language: str, question_no: int, question_text: str, options: List[dict],
+                 curated: bool = False):
+        self.department = department
+        self.language = language
+        self.question_no = question_no
+        self.question_text = question_text
+        self.options = options
+        self.key = normalize_question(question_text)
+        # Only the question is matched; option texts ("mild", "severe", ...) fit almost any complaint
+        self.keywords = keywords(question_text)
+        self.curated = curated
+        # (previous question, answer) pairs this question was generated after
+        self.paths: Set[AnswerPath] = set()
+        # How many times this question was generated or curated; used to break ties
+        self.seen = 1
+
+
+class QuestionBank:
+    """Previously generated and curated diagnosis questions, indexed for retrieval.
+
+    Questions are grouped by (department, language, question_no) and scored
+    by keyword overlap of the question with the patient's own messages. A
+    question is reused only when it overlaps enough, has not already been
+    asked in the chat, and is trusted: curated, or generated at least
+    ``min_seen`` times. Follow-up questions (question_no > 1) must also have
+    been generated after the same previous question and answer, unless
+    curated. Otherwise the diagnosis flow asks the LLM as before.
+    """
+
+    def __init__(self, enabled: bool = None, min_overlap: int = None, max_entries: int = None, curated_file: str = None,
+                 min_seen: int = None):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("QUESTION_BANK_ENABLED", "true").lower() in ("1", "true", "yes")
+        )
+        self.min_overlap = int(min_overlap if min_overlap is not None else os.getenv("QUESTION_BANK_MIN_OVERLAP", "2"))
+        self.min_seen = int(min_seen if min_seen is not None else os.getenv("QUESTION_BANK_MIN_SEEN", "2"))
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("QUESTION_BANK_MAX_ENTRIES", "20000"))
+        self.curated_file = curated_file if curated_file is not None else os.getenv("QUESTION_BANK_FILE", "")
+        # (department, language, question_no) -> normalized question -> entry
+        self._index: Dict[Tuple[str, str, int], Dict[str, BankQuestion]] = {}
+        self._entries = 0
+        self._load_lock = asyncio.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "loaded": 0, "learned": 0}
+
+    @staticmethod
+    def _group(department: str, language: str, question_no: int) -> Tuple[str, str, int]:
+        return ((department or "").strip().lower(), (language or "").strip().lower(), int(question_no))
+
+    def add(self, department: str, language: str, question_no: int, question_text: str, options: List[dict],
+            curated: bool = False, path: Optional[AnswerPath] = None) -> bool:
+        """Index a question with its four options; returns False if it was skipped"""
+        if not question_text or len(options) != 4 or not department:
+            return False
+        group = self._index.setdefault(self._group(department, language, question_no), {})
+        entry = BankQuestion(department, language, question_no, question_text, options, curated)
+        existing = group.get(entry.key)
+        if existing is not None:
+            existing.seen += 1
+            existing.curated = existing.curated or curated
+            if path is not None:
+                existing.paths.add(path)
+            return True
+        if self._entries >= self.max_entries:
+            return False
+        if path is not None:
+            entry.paths.add(path)
+        group[entry.key] = entry
+        self._entries += 1
+        return True
+
+    def learn(self, department: str, language: str, question_no: int, question_text: str, options: List[dict],
+              path: Optional[AnswerPath] = None):
+        """Add a question the LLM just generated after ``path`` (previous question, answer)"""
+        if self.enabled and self.add(department, language, question_no, question_text, options, path=path):
+            self._stats["learned"] += 1
+
+    def _eligible(self, entry: BankQuestion, question_no: int, path: Optional[AnswerPath]) -> bool:
+        if entry.curated:
+            return True
+        if entry.seen < self.min_seen:
+            return False
+        # A follow-up only fits the answer it was generated for
+        return question_no <= 1 or (path is not None and path in entry.paths)
+
+    def find(self, department: str, language: str, question_no: int,
+             conversation_history: List[Dict[str, str]], path: Optional[AnswerPath] = None,
+             record: bool = True) -> Optional[BankQuestion]:
+        """Best stored question for this turn, or None if no entry is a good enough match.
+
+        ``path`` is the previous question and the patient's answer to it (see
+        ``answer_path``). ``record=False`` peeks without counting towards the
+        hit-rate metric.
+        """
+        if not self.enabled:
+            return None
+        group = self._index.get(self._group(department, language, question_no))
+        best = None
+        if group:
+            # Complaint keywords come from what the patient wrote, not their A-D answers
+            patient_words: Set[str] = set()
+            asked: Set[str] = set()
+            for msg in conversation_history:
+                content = msg.get("content", "")
+                if msg["role"] == "user" and content.strip().upper() not in ("A", "B", "C", "D"):
+                    patient_words |= keywords(content)
+                elif msg["role"] == "assistant":
+                    asked.add(normalize_question(content.strip().split("\n", 1)[0]))
+            best_score = None
+            for entry in group.values():
+                if entry.key in asked or not self._eligible(entry, question_no, path):
+                    continue
+                overlap = len(entry.keywords & patient_words)
+                if overlap < self.min_overlap:
+                    continue
+                score = (overlap, entry.seen)
+                if best_score is None or score > best_score:
+                    best, best_score = entry, score
+        if record:
+            self._stats["lookups"] += 1
+            self._stats["hits" if best is not None else "misses"] += 1
+        return best
+
+    def _load_curated(self) -> int:
+        if not self.curated_file:
+            return 0
+        with open(self.curated_file, encoding="utf-8") as f:
+            curated = json.load(f)
+        count = 0
+        for item in curated:
+            options = [
+                {"option_no": option["option_no"], "option_text": option["text"], "ehr_terminology": option.get("ehr_terminology", "")}
+                for option in item.get("options", [])
+            ]
+            if self.add(item.get("department"), item.get("language", "English"), item.get("question_no", 1),
+                        item.get("question"), options, curated=True):
+                count += 1
+        return count
+
+    async def load(self):
+        """Index curated questions and the newest questions stored in MongoDB"""
+        if not self.enabled:
+            return
+        async with self._load_lock:
+            loaded = 0
+            try:
+                loaded += await asyncio.to_thread(self._load_curated)
+            except Exception as e:
+                logger.error(f"Could not load curated question bank {self.curated_file}: {str(e)}")
+            try:
+                for doc in await get_recent_questions_with_options(self.max_entries):
+                    chat = doc.get("chat") or [{}]
+                    options = sorted(doc.get("options", []), key=lambda option: option.get("option_no", ""))
+                    follows = doc.get("follows") or {}
+                    path = (follows["question"], follows["answer"]) if follows.get("question") and follows.get("answer") else None
+                    if self.add(chat[0].get("reason_for_visit"), chat[0].get("language"),
+                                doc.get("question_no", 1), doc.get("question_text"), options, path=path):
+                        loaded += 1
+            except Exception as e:
+                logger.error(f"Could not load stored questions into the question bank: {str(e)}")
+            self._stats["loaded"] += loaded
+            logger.info(f"Question bank loaded {loaded} questions ({self._entries} indexed)")
+
+    def stats(self) -> dict:
+        lookups = self._stats["lookups"]
+        return {
+            "enabled": self.enabled,
+            "entries": self._entries,
+            "groups": len(self._index),
+            "min_overlap": self.min_overlap,
+            "min_seen": self.min_seen,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Shared instance
+question_bank = QuestionBank()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFullError(Exception):
+    """Raised when more renders are pending than the queue limit allows"""
+
+
+class RenderPool:
+    """Bounded process pool for CPU-bound report rendering.
+
+    ReportLab holds the GIL for the whole build, so renders run in worker
+    processes and the event loop keeps serving /chat. At most ``queue_limit``
+    renders may be running or waiting; beyond that callers are rejected
+    instead of piling up.
+    """
+
+    def __init__(self, max_workers: int = None, queue_limit: int = None):
+        self.max_workers = int(
+            max_workers if max_workers is not None
+            else os.getenv("REPORT_RENDER_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self.queue_limit = int(queue_limit if queue_limit is not None else os.getenv("REPORT_RENDER_QUEUE_LIMIT", "32"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._stats = {
+            "rendered": 0,
+            "failed": 0,
+            "rejected": 0,
+            "total_render_ms": 0.0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self._executor is not None
+
+    def open(self):
+        """Start the worker processes (idempotent)"""
+        if self.is_open:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        logger.info(f"Report render pool opened (workers={self.max_workers}, queue_limit={self.queue_limit})")
+
+    def close(self):
+        if not self.is_open:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        logger.info("Report render pool closed")
+
+    async def render(self, func: Callable[..., Any], *args) -> Any:
+        """Run ``func(*args)`` in a worker process; ``func`` must be importable module-level"""
+        if self._pending >= self.queue_limit:
+            self._stats["rejected"] += 1
+            raise RenderQueueFullError(f"{self._pending} renders already pending")
+        self.open()
+        executor = self._executor
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            self._stats["rendered"] += 1
+            return result
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); replace the pool so later renders still work.
+            # One death fails every render pending on that pool, so only the first of
+            # them resets it, and never a pool a later render has already reopened.
+            self._stats["failed"] += 1
+            if self._executor is executor:
+                logger.error("Report render worker died; restarting render pool")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+            self._stats["total_render_ms"] += (time.perf_counter() - started) * 1000
+
+    def stats(self) -> dict:
+        finished = self._stats["rendered"] + self._stats["failed"]
+        return {
+            "open": self.is_open,
+            "max_workers": self.max_workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            **{k: v for k, v in self._stats.items() if k != "total_render_ms"},
+            "avg_render_ms": round(self._stats["total_render_ms"] / finished, 2) if finished else 0.0,
+        }
+
+
+# Shared instance
+render_pool = RenderPool()
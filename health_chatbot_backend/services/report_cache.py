@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+def report_content_key(name: str, age, gender: str, language: str,
+                       conversation_history: List[Dict[str, str]], department: Optional[str]) -> str:
+    """SHA-256 of everything that determines a consultation report"""
+    payload = json.dumps(
+        [name, age, gender, language, conversation_history, department],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def report_etag(key: str) -> str:
+    """Weak validator: the key names the conversation, but the LLM may word the report differently each build"""
+    return f'W/"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], key: str, exists: bool = True) -> bool:
+    """Weak comparison of an If-None-Match header against a report key.
+
+    ``*`` matches only when a report for the key ``exists``.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return exists
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == f'"{key}"' for tag in tags)
+
+
+class ReportArtifact:
+    def __init__(self, key: str, report_text: str, pdf: bytes):
+        self.key = key
+        self.report_text = report_text
+        self.pdf = pdf
+        self.created_at = time.time()
+
+    @property
+    def etag(self) -> str:
+        return report_etag(self.key)
+
+    @property
+    def size(self) -> int:
+        return len(self.pdf) + len(self.report_text.encode("utf-8"))
+
+
+class ReportCache:
+    """Content-addressed store of generated reports, evicted LRU by total bytes.
+
+    Concurrent requests for the same key share one build, so a retry storm
+    for the same conversation costs a single LLM call and render.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = int(max_bytes if max_bytes is not None else os.getenv("REPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self._artifacts: "OrderedDict[str, ReportArtifact]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "shared_builds": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[ReportArtifact]:
+        artifact = self._artifacts.get(key)
+        if artifact is not None:
+            self._artifacts.move_to_end(key)
+        return artifact
+
+    def put(self, artifact: ReportArtifact):
+        if artifact.size > self.max_bytes:
+            return
+        previous = self._artifacts.pop(artifact.key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._artifacts[artifact.key] = artifact
+        self._bytes += artifact.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._artifacts.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats["evictions"] += 1
+
+    async def get_or_build(self, key: str, build: Callable[[], Awaitable[ReportArtifact]]) -> ReportArtifact:
+        artifact = self.get(key)
+        if artifact is not None:
+            self._stats["hits"] += 1
+            return artifact
+        pending = self._building.get(key)
+        if pending is not None:
+            self._stats["shared_builds"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request that owned the build went away; build it here instead
+                return await self.get_or_build(key, build)
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._building[key] = future
+        try:
+            artifact = await build()
+            self.put(artifact)
+            future.set_result(artifact)
+            return artifact
+        except asyncio.CancelledError:
+            # Wake waiters so they can take over the build instead of hanging
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Only waiters should see the error; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._building[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._artifacts),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "building": len(self._building),
+            **self._stats,
+        }
+
+
+# Shared instance
+report_cache = ReportCache()
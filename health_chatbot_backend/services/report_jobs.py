@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReportQueueFullError(Exception):
+    """Raised when the report job backlog is at its limit"""
+
+
+class ReportJob:
+    def __init__(self, kind: str, payload):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.result_path: Optional[str] = None
+        self.media_type: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def describe(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReportJobQueue:
+    """Report generation decoupled from the HTTP request.
+
+    Submitting returns a job id at once; ``workers`` background tasks run the
+    LLM call and rendering, and store the result under ``result_dir`` where
+    it can be fetched by id until ``retention`` seconds after it finished.
+    """
+
+    def __init__(self, workers: int = None, queue_limit: int = None, result_dir: str = None, retention: float = None):
+        self.workers = int(workers if workers is not None else os.getenv("REPORT_JOB_WORKERS", "2"))
+        self.queue_limit = int(queue_limit if queue_limit is not None else os.getenv("REPORT_JOB_QUEUE_LIMIT", "100"))
+        self.result_dir = result_dir or os.getenv("REPORT_RESULT_DIR", "report_results")
+        self.retention = float(retention if retention is not None else os.getenv("REPORT_JOB_RETENTION", "3600"))
+        # kind -> (builder, media_type); builders return bytes (PDF) or a dict (JSON)
+        self._handlers: Dict[str, Tuple[Callable[..., Awaitable], str]] = {}
+        self._jobs: Dict[str, ReportJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "total_wait_ms": 0.0,
+            "total_run_ms": 0.0,
+        }
+
+    def register(self, kind: str, builder: Callable[..., Awaitable], media_type: str):
+        self._handlers[kind] = (builder, media_type)
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker tasks (idempotent)"""
+        if self.is_running:
+            return
+        os.makedirs(self.result_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_limit)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Report job queue started (workers={self.workers}, queue_limit={self.queue_limit})")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Report job queue stopped")
+
+    def submit(self, kind: str, payload) -> ReportJob:
+        if kind not in self._handlers:
+            raise KeyError(f"Unknown report kind '{kind}'")
+        self.start()
+        self._purge_expired()
+        job = ReportJob(kind, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise ReportQueueFullError(f"{self._queue.qsize()} report jobs already queued")
+        self._jobs[job.job_id] = job
+        self._stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def _result_path(self, job: ReportJob) -> str:
+        extension = "pdf" if job.media_type == "application/pdf" else "json"
+        return os.path.join(self.result_dir, f"{job.job_id}.{extension}")
+
+    @staticmethod
+    def _write_result(path: str, result):
+        if isinstance(result, (bytes, bytearray)):
+            with open(path, "wb") as f:
+                f.write(result)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+
+    async def _run(self, job: ReportJob):
+        builder, job.media_type = self._handlers[job.kind]
+        job.status = "running"
+        job.started_at = time.time()
+        self._stats["total_wait_ms"] += (job.started_at - job.created_at) * 1000
+        try:
+            result = await builder(job.payload)
+            path = self._result_path(job)
+            await asyncio.to_thread(self._write_result, path, result)
+            job.result_path = path
+            job.status = "done"
+            self._stats["completed"] += 1
+        except Exception as e:
+            job.status = "failed"
+            # Exception text can name hosts, paths or queries; it stays in the log only
+            job.error = "Report generation failed"
+            self._stats["failed"] += 1
+            logger.error(f"Report job {job.job_id} ({job.kind}) failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            job.payload = None
+            self._stats["total_run_ms"] += (job.finished_at - job.started_at) * 1000
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.retention
+        expired = [job for job in self._jobs.values() if job.finished_at and job.finished_at < cutoff]
+        for job in expired:
+            del self._jobs[job.job_id]
+            if job.result_path:
+                try:
+                    os.remove(job.result_path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        finished = self._stats["completed"] + self._stats["failed"]
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": statuses,
+            **{k: v for k, v in self._stats.items() if not k.startswith("total_")},
+            "avg_wait_ms": round(self._stats["total_wait_ms"] / finished, 2) if finished else 0.0,
+            "avg_run_ms": round(self._stats["total_run_ms"] / finished, 2) if finished else 0.0,
+        }
+
+
+# Shared instance
+report_jobs = ReportJobQueue()
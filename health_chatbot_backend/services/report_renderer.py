@@ -0,0 +1,101 @@
+from io import BytesIO
+from typing import Iterator, List
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_LEFT
+
+# Kept free of FastAPI/LangChain imports: these functions run inside
+# report render worker processes (see services/render_pool.py).
+
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def build_report_styles() -> dict:
+    base_styles = getSampleStyleSheet()
+    return {
+        "heading": ParagraphStyle(
+            'Heading',
+            parent=base_styles['Heading2'],
+            fontSize=14,
+            spaceAfter=10,
+            spaceBefore=12,
+            leftIndent=0,
+            alignment=TA_LEFT,
+            fontName='Helvetica-Bold'
+        ),
+        "body": ParagraphStyle(
+            'Body',
+            parent=base_styles['Normal'],
+            fontSize=11,
+            leading=16,
+            leftIndent=20
+        ),
+    }
+
+
+class ConsultationReportTemplate:
+    """Layout of the consultation report, built once and reused for every render.
+
+    Styles are immutable after construction, so one instance is shared by
+    all renders in a process (each render worker builds its own on import).
+    Flowables are not: ReportLab keeps layout state on them, so every render
+    gets fresh Paragraphs.
+    """
+
+    def __init__(self, pagesize=letter, styles: dict = None):
+        self.pagesize = pagesize
+        self.styles = styles or build_report_styles()
+        self._heading_style = self.styles["heading"]
+        self._body_style = self.styles["body"]
+
+    def build_story(self, name: str, gender: str, age, report_text: str) -> List:
+        heading_style = self._heading_style
+        body_style = self._body_style
+        story = [
+            # Title
+            Paragraph("Medical Consultation Report", heading_style),
+            Spacer(1, 12),
+            # Patient Details Section
+            Paragraph("Patient Details", heading_style),
+            Spacer(1, 6),
+            Paragraph(f"Name: {name}", body_style),
+            Paragraph(f"Gender: {gender}", body_style),
+            Paragraph(f"Age: {age}", body_style),
+            Spacer(1, 12),
+        ]
+
+        # Split report into sections and format
+        for paragraph in report_text.split('\n\n'):
+            stripped = paragraph.strip()
+            if not stripped:
+                continue
+            if stripped.endswith(":"):  # Assume it's a heading
+                story.append(Spacer(1, 10))
+                story.append(Paragraph(stripped, heading_style))
+            else:
+                story.append(Paragraph(stripped, body_style))
+            story.append(Spacer(1, 6))
+        return story
+
+    def render(self, name: str, gender: str, age, report_text: str) -> bytes:
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=self.pagesize)
+        doc.build(self.build_story(name, gender, age, report_text))
+        return buffer.getvalue()
+
+
+consultation_template = ConsultationReportTemplate()
+
+
+def render_consultation_pdf(name: str, gender: str, age, report_text: str) -> bytes:
+    """Render the consultation report PDF and return its bytes"""
+    return consultation_template.render(name, gender, age, report_text)
+
+
+def iter_pdf_chunks(pdf_bytes: bytes, chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the PDF in chunks so large reports are sent without another full copy"""
+    view = memoryview(pdf_bytes)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
@@ -1,121 +1,130 @@
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from io import BytesIO
 import json
 import re
 
 from fastapi import HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from models.request_models import HistoryRequest,OfflineReportRequest
-# Import llm from settings
-from config.settings import llm, logger
-from models.prompts import REPORT_PROMPT, OFFLINE_REPORT_PROMPT
+# Import logger from settings and the shared LLM runner
+from config.settings import logger
+from utils.llm_utils import run_chain
+from services.render_pool import render_pool, RenderQueueFullError
+from services.report_renderer import render_consultation_pdf, iter_pdf_chunks
+from services.report_jobs import report_jobs
+from services.report_cache import report_cache, report_content_key, report_etag, etag_matches, ReportArtifact
+from utils.llm_gateway import is_overload_error
+from utils.context_builder import build_prompt_context, REPORT_CONTEXT_TOKEN_BUDGET
 
 from fastapi import APIRouter
 
 app = APIRouter()
 
-@app.post("/generate_report")
-async def generate_report(request: HistoryRequest):
-    try:    
-        # Extract name, gender, and age from the request
-        name = request.name
-        gender = request.gender
-        age = request.age
-        language = request.language  # New field for language support
-        
-        # Extract chief complaint
-        chief_complaint = next(
-            (msg["content"] for msg in request.conversation_history 
-             if msg["role"] == "user"),
-            "Not specified"
-        )
-        
-        # Build conversation history
-        conv_history = "\n".join(
-            f"{msg['role'].upper()}: {msg['content']}" 
-            for msg in request.conversation_history
-        )
-
-        # Prepare LangChain LLM call
-        prompt = PromptTemplate(
-            input_variables=["chief_complaint", "history", "conversation_history","language"],
-            template=REPORT_PROMPT
-        )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        report_text = await chain.arun(
-            chief_complaint=chief_complaint,
-            history="From conversation",
-            conversation_history=conv_history,
-            language=language  # Include language in the prompt
-        )
+def consultation_report_key(request: HistoryRequest) -> str:
+    return report_content_key(
+        request.name, request.age, request.gender, request.language,
+        request.conversation_history, request.department
+    )
+
+
+async def render_consultation_report(request: HistoryRequest, key: str) -> ReportArtifact:
+    """LLM report text for the conversation, rendered to PDF"""
+    # Extract chief complaint
+    chief_complaint = next(
+        (msg["content"] for msg in request.conversation_history 
+         if msg["role"] == "user"),
+        "Not specified"
+    )
+    
+    # Build conversation history; system messages are kept, as the report always included them
+    conv_history = build_prompt_context(
+        request.conversation_history, token_budget=REPORT_CONTEXT_TOKEN_BUDGET, include_system=True
+    )
+
+    # Run the prebuilt report chain
+    report_text = await run_chain(
+        "report",
+        chief_complaint=chief_complaint,
+        history="From conversation",
+        conversation_history=conv_history,
+        language=request.language  # Include language in the prompt
+    )
+
+    # PDF rendering is CPU-bound: run it in a worker process
+    pdf_bytes = await render_pool.render(
+        render_consultation_pdf, request.name, request.gender, request.age, report_text
+    )
+    return ReportArtifact(key, report_text, pdf_bytes)
+
+
+async def get_consultation_report(request: HistoryRequest) -> ReportArtifact:
+    """Cached report for identical conversations, generated on first request"""
+    key = consultation_report_key(request)
+    return await report_cache.get_or_build(key, lambda: render_consultation_report(request, key))
+
+
+async def build_consultation_report(request: HistoryRequest) -> bytes:
+    artifact = await get_consultation_report(request)
+    return artifact.pdf
+
+
+def pdf_response(artifact: ReportArtifact, cache_status: str):
+    return StreamingResponse(
+        iter_pdf_chunks(artifact.pdf),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": "attachment; filename=medical_report.pdf",
+            "Content-Length": str(len(artifact.pdf)),
+            "ETag": artifact.etag,
+            "Cache-Control": "private, no-cache",
+            "X-Report-Cache": cache_status,
+        }
+    )
+
+
+async def build_offline_report(request: OfflineReportRequest) -> dict:
+    report_content = await run_chain(
+        "offline_report",
+        name=request.name,
+        age=request.age,
+        gender=request.gender,
+        department=request.department,
+        language=request.language,  # Include language in the prompt
+        responses=request.responses,
+    )
+
+    return {
+        "Patient Details": {
+            "Name": request.name,
+            "Age": request.age,
+            "Gender": request.gender,
+            "Department": request.department,
+            "Language": request.language,  # Include language in the JSON response
+        },
+        "Report": report_content,
+        "Remarks": "This is an auto-generated offline medical  with language consideration.",
+    }
 
-        # PDF Generation with styling
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-
-        # Styles
-        base_styles = getSampleStyleSheet()
-        heading_style = ParagraphStyle(
-            'Heading',
-            parent=base_styles['Heading2'],
-            fontSize=14,
-            spaceAfter=10,
-            spaceBefore=12,
-            leftIndent=0,
-            alignment=TA_LEFT,
-            fontName='Helvetica-Bold'
-        )
-        body_style = ParagraphStyle(
-            'Body',
-            parent=base_styles['Normal'],
-            fontSize=11,
-            leading=16,
-            leftIndent=20
-        )
-
-        story = []
-
-        # Title
-        story.append(Paragraph("Medical Consultation Report", heading_style))
-        story.append(Spacer(1, 12))
-
-        # Patient Details Section
-        story.append(Paragraph("Patient Details", heading_style))
-        story.append(Spacer(1, 6))
-        story.append(Paragraph(f"Name: {name}", body_style))
-        story.append(Paragraph(f"Gender: {gender}", body_style))
-        story.append(Paragraph(f"Age: {age}", body_style))
-        story.append(Spacer(1, 12))
-
-        # Split report into sections and format
-        for paragraph in report_text.split('\n\n'):
-            stripped = paragraph.strip()
-            if not stripped:
-                continue
-            if stripped.endswith(":"):  # Assume it's a heading
-                story.append(Spacer(1, 10))
-                story.append(Paragraph(stripped, heading_style))
-            else:
-                story.append(Paragraph(stripped, body_style))
-            story.append(Spacer(1, 6))
-
-        doc.build(story)
-        buffer.seek(0)
-
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=medical_report.pdf"}
-        )
 
+@app.post("/generate_report")
+async def generate_report(request: HistoryRequest, if_none_match: Optional[str] = None):
+    try:
+        key = consultation_report_key(request)
+        # The (weak) ETag names the conversation content, so a client holding it already has a report for it
+        cached = report_cache.get(key) is not None
+        if etag_matches(if_none_match, key, exists=cached):
+            return Response(status_code=304, headers={"ETag": report_etag(key)})
+        cache_status = "hit" if cached else "miss"
+        artifact = await get_consultation_report(request)
+        return pdf_response(artifact, cache_status)
+
+    except RenderQueueFullError:
+        logger.warning("Report render queue full; rejecting report")
+        raise HTTPException(503, "Report service busy, please retry")
     except Exception as e:
+        if is_overload_error(e):
+            raise HTTPException(503, "Report service busy, please retry")
         logger.error(f"Report error: {str(e)}")
         raise HTTPException(500, "Report generation failed")
     
@@ -123,36 +132,17 @@ async def generate_report(request: HistoryRequest):
 
 async def generate_offline_report(request: OfflineReportRequest):
     try:
-        prompt = PromptTemplate(
-            input_variables=["name", "age", "gender", "department", "language", "responses"],
-            template=OFFLINE_REPORT_PROMPT
-        )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        report_content = await chain.arun(
-            name=request.name,
-            age=request.age,
-            gender=request.gender,
-            department=request.department,
-            language=request.language,  # Include language in the prompt
-            responses=request.responses,
-        )
-
-        report = {
-            "Patient Details": {
-                "Name": request.name,
-                "Age": request.age,
-                "Gender": request.gender,
-                "Department": request.department,
-                "Language": request.language,  # Include language in the JSON response
-            },
-            "Report": report_content,
-            "Remarks": "This is an auto-generated offline medical  with language consideration.",
-        }
-
+        report = await build_offline_report(request)
         return JSONResponse(
             content=report,
             headers={"Content-Disposition": "attachment; filename=offline_report.json"}
         )
     except Exception as e:
+        if is_overload_error(e):
+            raise HTTPException(503, "Report service busy, please retry")
         logger.error(f"Error in /generate_offline_report endpoint: {str(e)}")
         raise HTTPException(500, "Offline report generation failed")
+
+
+report_jobs.register("consultation", build_consultation_report, "application/pdf")
+report_jobs.register("offline", build_offline_report, "application/json")
@@ -0,0 +1,97 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from models.database import get_session_data, save_session_data
+from utils.conversation_state import ConversationState
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """Server-side copy of one chat's history, keyed by chat_history_id"""
+
+    def __init__(self, chat_history_id: str, history: List[Dict[str, str]] = None, last_question_id: str = None):
+        self.chat_history_id = chat_history_id
+        self.history = history or []
+        self.last_question_id = last_question_id
+        # Derived state for `history`; rebuilt from history when loaded from Mongo
+        self.state: Optional[ConversationState] = None
+        self.touched_at = time.monotonic()
+
+
+class SessionStore:
+    """In-memory LRU of chat sessions with idle expiry.
+
+    With the "mongo" backend every save is also written to the chat_history
+    collection, and sessions evicted from memory (or lost on restart) are
+    loaded back from there.
+    """
+
+    def __init__(self, backend: str = None, max_sessions: int = None, idle_ttl: float = None):
+        self.backend = (backend or os.getenv("SESSION_STORE_BACKEND", "memory")).lower()
+        self.max_sessions = int(max_sessions if max_sessions is not None else os.getenv("SESSION_MAX_ENTRIES", "5000"))
+        self.idle_ttl = float(idle_ttl if idle_ttl is not None else os.getenv("SESSION_IDLE_TTL", "3600"))
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "loaded": 0, "evictions": 0, "expired": 0}
+
+    def _remember(self, session: Session):
+        session.touched_at = time.monotonic()
+        self._sessions[session.chat_history_id] = session
+        self._sessions.move_to_end(session.chat_history_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def get(self, chat_history_id: str) -> Optional[Session]:
+        if not chat_history_id:
+            return None
+        session = self._sessions.get(chat_history_id)
+        if session is not None:
+            if time.monotonic() - session.touched_at < self.idle_ttl:
+                self._stats["hits"] += 1
+                self._remember(session)
+                return session
+            del self._sessions[chat_history_id]
+            self._stats["expired"] += 1
+
+        if self.backend == "mongo":
+            try:
+                data = await get_session_data(chat_history_id)
+            except Exception as e:
+                logger.error(f"Session load error: {str(e)}")
+                data = None
+            if data and data.get("conversation_history"):
+                session = Session(chat_history_id, data["conversation_history"], data.get("last_question_id"))
+                self._stats["loaded"] += 1
+                self._remember(session)
+                return session
+
+        self._stats["misses"] += 1
+        return None
+
+    async def save(self, session: Session):
+        self._remember(session)
+        if self.backend == "mongo":
+            try:
+                await save_session_data(session.chat_history_id, {
+                    "conversation_history": session.history,
+                    "last_question_id": session.last_question_id
+                })
+            except Exception as e:
+                logger.error(f"Session save error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            **self._stats,
+        }
+
+
+# Shared store used by /chat
+session_store = SessionStore()
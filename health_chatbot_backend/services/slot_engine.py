@@ -0,0 +1,180 @@
+import logging
+import os
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# Length of a bookable slot; the last slot of a window may be shorter
+DEFAULT_SLOT_MINUTES = int(os.getenv("SLOT_LENGTH_MINUTES", "60"))
+
+# Days without consultations (Monday=0 ... Sunday=6)
+CLOSED_WEEKDAYS = (6,)
+
+Interval = Tuple[int, int]
+
+logger = logging.getLogger(__name__)
+
+
+def to_minutes(value) -> int:
+    """Convert 'HH:MM', 'HH:MM:SS', time, datetime or timedelta to minutes after midnight"""
+    if isinstance(value, str):
+        parts = value.strip().split(":")
+        return int(parts[0]) * 60 + int(parts[1])
+    if isinstance(value, datetime):
+        return value.hour * 60 + value.minute
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60)
+    raise ValueError(f"Unsupported time value: {value!r}")
+
+
+def to_date_key(value) -> str:
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+@lru_cache(maxsize=1440)
+def _format_minutes(minutes: int) -> Tuple[str, str]:
+    """(12-hour label, 24-hour label) for a minute-of-day"""
+    hour, minute = divmod(minutes, 60)
+    label_24h = f"{hour:02d}:{minute:02d}"
+    label_12h = f"{(hour % 12) or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+    return label_12h, label_24h
+
+
+@lru_cache(maxsize=512)
+def _format_date(day: date) -> Tuple[str, str, str]:
+    """(ISO date, 'Month DD, YYYY', weekday name) for a calendar day"""
+    return day.strftime('%Y-%m-%d'), day.strftime('%B %d, %Y'), day.strftime('%A')
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and merge overlapping or touching intervals"""
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def build_working_windows(working_hours: Iterable[Tuple[str, str]]) -> List[Interval]:
+    """Parse working hours like [("09:00", "12:00")] once into merged minute intervals"""
+    return merge_intervals((to_minutes(start), to_minutes(end)) for start, end in working_hours)
+
+
+def build_busy_index(busy_slots: Iterable[dict]) -> Dict[str, Tuple[List[int], List[int]]]:
+    """Group busy slot rows by date into merged, sorted (starts, ends) arrays.
+
+    Malformed rows are logged and skipped so one bad booking cannot blank the
+    calendar; zero-length rows still block the slot they fall in.
+    """
+    by_date: Dict[str, List[Interval]] = {}
+    for slot in busy_slots:
+        try:
+            date_key = to_date_key(slot["date"])
+            start, end = to_minutes(slot["start_time"]), to_minutes(slot["end_time"])
+        except (KeyError, ValueError, TypeError, AttributeError, IndexError) as e:
+            logger.warning(f"Skipping malformed busy slot {slot!r}: {e}")
+            continue
+        if end == start:
+            end = start + 1
+        by_date.setdefault(date_key, []).append((start, end))
+    index = {}
+    for date_key, intervals in by_date.items():
+        merged = merge_intervals(intervals)
+        index[date_key] = ([start for start, _ in merged], [end for _, end in merged])
+    return index
+
+
+def build_slot_grid(windows: List[Interval], slot_minutes: int) -> List[Interval]:
+    """Cut working windows into consecutive slots; the last one may be shorter"""
+    grid = []
+    for window_start, window_end in windows:
+        for slot_start in range(window_start, window_end, slot_minutes):
+            grid.append((slot_start, min(slot_start + slot_minutes, window_end)))
+    return grid
+
+
+def free_slots_for_day(grid: List[Interval], busy: Tuple[List[int], List[int]]) -> List[int]:
+    """Indexes of grid slots that do not overlap any merged busy interval"""
+    busy_starts, busy_ends = busy
+    if not busy_starts:
+        return list(range(len(grid)))
+    free = []
+    for i, (slot_start, slot_end) in enumerate(grid):
+        # First busy interval that ends after this slot starts
+        j = bisect_right(busy_ends, slot_start)
+        if j == len(busy_starts) or busy_starts[j] >= slot_end:
+            free.append(i)
+    return free
+
+
+def compute_available_slots(
+    working_hours: Iterable[Tuple[str, str]],
+    busy_slots: Iterable[dict],
+    days_ahead: int = 7,
+    slot_minutes: int = None,
+    start_date: date = None,
+) -> List[dict]:
+    """Free slots for every open day in (start_date, start_date + days_ahead].
+
+    Returns the day/slot structure the appointment agent renders.
+    """
+    slot_minutes = slot_minutes or DEFAULT_SLOT_MINUTES
+    start_date = start_date or datetime.now().date()
+    grid = build_slot_grid(build_working_windows(working_hours), slot_minutes)
+    busy_index = build_busy_index(busy_slots)
+
+    # Slot dicts are formatted once per grid position and shared across days
+    formatted_grid = []
+    for slot_start, slot_end in grid:
+        start_12h, start_24h = _format_minutes(slot_start)
+        end_12h, end_24h = _format_minutes(slot_end)
+        formatted_grid.append({
+            'time': start_12h,
+            'end_time': end_12h,
+            'start_24h': start_24h,
+            'end_24h': end_24h
+        })
+
+    available_slots = []
+    for day in range(1, days_ahead + 1):
+        current_date = start_date + timedelta(days=day)
+        if current_date.weekday() in CLOSED_WEEKDAYS:
+            continue
+
+        date_str, formatted_date, day_name = _format_date(current_date)
+        busy = busy_index.get(date_str)
+        if busy:
+            day_slots = [formatted_grid[i] for i in free_slots_for_day(grid, busy)]
+        else:
+            day_slots = list(formatted_grid)
+
+        if day_slots:
+            available_slots.append({
+                'date': date_str,
+                'formatted_date': formatted_date,
+                'day_name': day_name,
+                'slots': day_slots
+            })
+    return available_slots
+
+
+def first_free_slot(available_slots: List[dict]):
+    """Earliest slot of a compute_available_slots result, flattened with its date"""
+    if not available_slots:
+        return None
+    first_day = available_slots[0]
+    return {
+        'date': first_day['date'],
+        'formatted_date': first_day['formatted_date'],
+        'day_name': first_day['day_name'],
+        **first_day['slots'][0]
+    }
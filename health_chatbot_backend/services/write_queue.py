@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriteQueue:
+    """Bounded queue of MongoDB writes drained by a single background worker.
+
+    Callers hand over a coroutine factory and return immediately, so a
+    request only waits on the LLM. When the queue is full the write runs
+    inline instead (backpressure rather than unbounded memory), and
+    ``close()`` drains everything still queued before the client shuts down.
+    Writes submitted with a ``key`` can be awaited individually via ``wait_for``.
+    """
+
+    def __init__(self, max_size: int = None, enabled: bool = None):
+        self.max_size = int(max_size if max_size is not None else os.getenv("MONGO_WRITE_QUEUE_SIZE", "1000"))
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("MONGO_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # key -> future resolved once that write has been attempted
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "failed": 0,
+            "inline": 0,
+            "total_write_ms": 0.0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start the worker (idempotent). Writes run inline until this is called."""
+        if not self.enabled or self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._worker = asyncio.create_task(self._drain())
+        logger.info(f"Background write queue started (max_size={self.max_size})")
+
+    async def _write(self, label: str, write: Callable[[], Awaitable], key: Optional[str] = None):
+        started = time.perf_counter()
+        try:
+            await write()
+            self._stats["written"] += 1
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.error(f"Background write '{label}' failed: {str(e)}")
+        finally:
+            self._stats["total_write_ms"] += (time.perf_counter() - started) * 1000
+            pending = self._pending.pop(key, None) if key is not None else None
+            if pending is not None and not pending.done():
+                pending.set_result(None)
+
+    async def _drain(self):
+        while True:
+            label, write, key = await self._queue.get()
+            try:
+                await self._write(label, write, key)
+            finally:
+                self._queue.task_done()
+
+    async def submit(self, label: str, write: Callable[[], Awaitable], key: Optional[str] = None):
+        """Queue ``write()``; runs it inline if the queue is disabled or full"""
+        self._stats["submitted"] += 1
+        if self.is_running:
+            try:
+                self._queue.put_nowait((label, write, key))
+                if key is not None:
+                    self._pending[key] = asyncio.get_running_loop().create_future()
+                return
+            except asyncio.QueueFull:
+                logger.warning(f"Write queue full; writing '{label}' inline")
+        self._stats["inline"] += 1
+        await self._write(label, write, key)
+
+    async def wait_for(self, key: str):
+        """Wait until the write submitted under ``key`` has been attempted (no-op if none is pending)"""
+        pending = self._pending.get(key)
+        if pending is not None:
+            await asyncio.shield(pending)
+
+    async def flush(self):
+        """Wait until every queued write has been attempted"""
+        if self.is_running:
+            await self._queue.join()
+
+    async def close(self):
+        """Flush pending writes and stop the worker"""
+        if not self.is_running:
+            return
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        logger.info("Background write queue flushed and stopped")
+
+    def stats(self) -> dict:
+        written = self._stats["written"] + self._stats["failed"]
+        return {
+            "enabled": self.enabled,
+            "running": self.is_running,
+            "max_size": self.max_size,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            **{k: v for k, v in self._stats.items() if k != "total_write_ms"},
+            "avg_write_ms": round(self._stats["total_write_ms"] / written, 2) if written else 0.0,
+        }
+
+
+# Shared instance
+write_queue = BackgroundWriteQueue()
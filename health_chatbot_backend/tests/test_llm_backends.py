@@ -0,0 +1,130 @@
+"""LLM backend pool against stub Ollama servers (benchmarks/stub_ollama.py).
+
+Run from health_chatbot_backend/:
+
+    python -m unittest tests.test_llm_backends
+"""
+import socket
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+from benchmarks.stub_ollama import make_handler
+from config.settings import LLM_PROFILES
+from utils import llm_utils
+from utils.llm_backends import LLMBackendPool, NoLLMBackendError
+
+MODEL = LLM_PROFILES["default"]["model"]
+
+
+def unused_url() -> str:
+    """Base URL of a local port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+class StubOllama:
+    def __init__(self, model: str = MODEL, fail_status: int = None):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+        self.port = self.server.server_address[1]
+        self.server.RequestHandlerClass = make_handler(self.port, model, 0.0, 3, fail_status)
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LLMBackendPoolTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stubs = []
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.stop()
+
+    def start_stub(self, **kwargs) -> StubOllama:
+        stub = StubOllama(**kwargs)
+        self.stubs.append(stub)
+        return stub
+
+    def use_pool(self, pool: LLMBackendPool):
+        patcher = mock.patch.object(llm_utils, "llm_backends", pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_health_check_marks_unreachable_backend(self):
+        live = self.start_stub()
+        pool = LLMBackendPool([live.url, unused_url()], health_check_timeout=1)
+        await pool.check_all()
+        healthy, dead = pool.backends
+        self.assertTrue(healthy.healthy)
+        self.assertNotIn(MODEL, healthy.missing_models)
+        self.assertFalse(dead.healthy)
+        self.assertIsNotNone(dead.last_error)
+
+    async def test_backend_without_model_goes_last(self):
+        other = self.start_stub(model="some-other-model")
+        live = self.start_stub()
+        pool = LLMBackendPool([other.url, live.url], health_check_timeout=1)
+        await pool.check_all()
+        for _ in range(len(pool.backends)):
+            self.assertEqual(pool.candidates(model=MODEL)[0].base_url, live.url)
+
+    async def test_fails_over_unreachable_backend(self):
+        live = self.start_stub()
+        pool = LLMBackendPool([unused_url(), live.url])
+        self.use_pool(pool)
+        response = await llm_utils.run_chain("clarification", user_input="hello", language="English")
+        self.assertTrue(response.startswith(f"stub-{live.port}"))
+        self.assertEqual(pool.stats()["failovers"], 1)
+        self.assertFalse(pool.backends[0].healthy)
+
+    async def test_fails_over_http_error(self):
+        failing = self.start_stub(fail_status=500)
+        live = self.start_stub()
+        pool = LLMBackendPool([failing.url, live.url])
+        self.use_pool(pool)
+        response = await llm_utils.run_chain("clarification", user_input="hello", language="English")
+        self.assertTrue(response.startswith(f"stub-{live.port}"))
+        self.assertFalse(pool.backends[0].healthy)
+
+    async def test_missing_model_keeps_backend_in_rotation(self):
+        missing = self.start_stub(fail_status=404)
+        live = self.start_stub()
+        pool = LLMBackendPool([missing.url, live.url])
+        self.use_pool(pool)
+        await llm_utils.run_chain("clarification", user_input="hello", language="English")
+        self.assertTrue(pool.backends[0].healthy)
+        self.assertIn(MODEL, pool.backends[0].missing_models)
+
+    async def test_missing_classifier_model_falls_back_to_default_profile(self):
+        live = self.start_stub()
+        pool = LLMBackendPool([live.url])
+        self.use_pool(pool)
+        classifier_model = LLM_PROFILES["classification"]["model"]
+        if classifier_model == MODEL:
+            self.skipTest("classifier profile already uses the default model")
+        response = await llm_utils.run_chain("intent", user_input="book a doctor", language="English", context="")
+        self.assertTrue(response.startswith(f"stub-{live.port}"))
+        self.assertIn(classifier_model, pool.backends[0].missing_models)
+        self.assertEqual(llm_utils.resolve_profile("classification"), "default")
+
+    async def test_all_backends_down_raises(self):
+        pool = LLMBackendPool([unused_url(), unused_url()])
+        self.use_pool(pool)
+        with self.assertRaises(NoLLMBackendError):
+            await llm_utils.run_chain("clarification", user_input="hello", language="English")
+
+    def test_empty_backend_list_rejected(self):
+        with self.assertRaises(ValueError):
+            LLMBackendPool([])
+
+
+if __name__ == "__main__":
+    unittest.main()
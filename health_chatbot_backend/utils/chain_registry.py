@@ -0,0 +1,152 @@
+import logging
+import os
+from string import Formatter
+from typing import Dict, List, Tuple
+
+from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, PromptTemplate
+from langchain_core.messages import SystemMessage
+
+# Import llm from settings
+from config.settings import llm
+from models.prompts import (
+    GREETING_AGENT_PROMPT, INTENT_DETECTION_PROMPT, CLARIFICATION_PROMPT, MEDICAL_PROMPT, MEDICAL_JSON_PROMPT,
+    SMART_APPOINTMENT_PROMPT, LOCATION_COLLECTION_PROMPT, ENHANCED_DOCTOR_DISPLAY_PROMPT,
+    DOCTOR_SELECTION_PROMPT, SLOT_AVAILABILITY_PROMPT, SLOT_SELECTION_PROMPT,
+    BOOKING_CONFIRMATION_PROMPT, FINAL_BOOKING_CONFIRMATION_PROMPT,
+    DEPARTMENT_PROMPT, REPORT_PROMPT, OFFLINE_REPORT_PROMPT
+)
+
+logger = logging.getLogger(__name__)
+
+# name -> (template, kind)
+#   "system":       system message only
+#   "system_human": system message followed by the user's message as {user_input}
+#   "text":         plain completion prompt
+PROMPT_SPECS = {
+    "greeting": (GREETING_AGENT_PROMPT, "system"),
+    "intent": (INTENT_DETECTION_PROMPT, "system"),
+    "clarification": (CLARIFICATION_PROMPT, "system"),
+    "medical": (MEDICAL_PROMPT, "system_human"),
+    "medical_structured": (MEDICAL_JSON_PROMPT, "system_human"),
+    "smart_appointment": (SMART_APPOINTMENT_PROMPT, "system_human"),
+    "location_collection": (LOCATION_COLLECTION_PROMPT, "system_human"),
+    "doctor_display": (ENHANCED_DOCTOR_DISPLAY_PROMPT, "system_human"),
+    "doctor_selection": (DOCTOR_SELECTION_PROMPT, "system_human"),
+    "slot_availability": (SLOT_AVAILABILITY_PROMPT, "system_human"),
+    "slot_selection": (SLOT_SELECTION_PROMPT, "system_human"),
+    "booking_confirmation": (BOOKING_CONFIRMATION_PROMPT, "system_human"),
+    "final_booking_confirmation": (FINAL_BOOKING_CONFIRMATION_PROMPT, "system_human"),
+    "department": (DEPARTMENT_PROMPT, "text"),
+    "report": (REPORT_PROMPT, "text"),
+    "offline_report": (OFFLINE_REPORT_PROMPT, "text"),
+}
+
+
+# "inline": variables are formatted into the instruction text (original behaviour).
+# "stable_prefix": the instruction text is sent verbatim as the first message and the
+# variables follow it, so every call of a chain starts with identical tokens and
+# Ollama can reuse the prefilled prefix from its KV cache.
+PROMPT_ASSEMBLY_MODE = os.getenv("PROMPT_ASSEMBLY_MODE", "inline")
+
+# Variables that stay the same for a whole chat go first in the values block,
+# then the (append-only) conversation, then what changes every turn.
+SESSION_STABLE_VARIABLES = ("language", "department", "name", "age", "gender",
+                            "doctor_name", "doctor_department", "doctor_location")
+GROWING_VARIABLES = ("conversation_history",)
+
+
+def split_static_prefix(template: str) -> Tuple[str, List[str]]:
+    """Template text with each {variable} replaced by a [variable] reference, plus the variable names"""
+    static_parts = []
+    variables: List[str] = []
+    for literal_text, field_name, _, _ in Formatter().parse(template):
+        static_parts.append(literal_text)
+        if field_name is not None:
+            static_parts.append(f"[{field_name}]")
+            if field_name not in variables:
+                variables.append(field_name)
+    return "".join(static_parts), variables
+
+
+def order_variables(variables: List[str]) -> List[str]:
+    def rank(name: str):
+        if name in SESSION_STABLE_VARIABLES:
+            return (0, SESSION_STABLE_VARIABLES.index(name))
+        if name in GROWING_VARIABLES:
+            return (1, 0)
+        if name == "user_input":
+            return (3, 0)
+        return (2, name)
+    return sorted(variables, key=rank)
+
+
+def compile_stable_prefix_prompt(template: str, kind: str):
+    static_text, variables = split_static_prefix(template)
+    messages = [SystemMessage(content=static_text)]
+    if variables:
+        values_block = "Values for this request:\n" + "\n".join(
+            f"[{name}]:\n{{{name}}}" if name in GROWING_VARIABLES else f"[{name}]: {{{name}}}"
+            for name in order_variables(variables)
+        )
+        messages.append(SystemMessagePromptTemplate.from_template(values_block))
+    if kind == "system_human":
+        messages.append(HumanMessagePromptTemplate.from_template("{user_input}"))
+    return ChatPromptTemplate.from_messages(messages)
+
+
+def compile_prompt(template: str, kind: str, mode: str = None):
+    """Parse a template from models/prompts.py once into a LangChain prompt"""
+    if (mode or PROMPT_ASSEMBLY_MODE) == "stable_prefix":
+        return compile_stable_prefix_prompt(template, kind)
+    if kind == "text":
+        return PromptTemplate.from_template(template)
+    messages = [SystemMessagePromptTemplate.from_template(template)]
+    if kind == "system_human":
+        messages.append(HumanMessagePromptTemplate.from_template("{user_input}"))
+    return ChatPromptTemplate.from_messages(messages)
+
+
+class RegisteredChain:
+    """A compiled prompt piped into the LLM, reused for every request"""
+
+    def __init__(self, name: str, prompt, model):
+        self.name = name
+        self.prompt = prompt
+        self.runnable = prompt | model
+        self.input_variables: List[str] = sorted(prompt.input_variables)
+        self._runnables = {id(model): self.runnable}
+
+    def runnable_for(self, model):
+        """The same compiled prompt piped into another LLM client (e.g. another Ollama backend)"""
+        runnable = self._runnables.get(id(model))
+        if runnable is None:
+            runnable = self._runnables[id(model)] = self.prompt | model
+        return runnable
+
+    def bind(self, variables: dict) -> dict:
+        """Keep only this chain's declared variables; fail fast on missing ones"""
+        missing = [name for name in self.input_variables if name not in variables]
+        if missing:
+            raise KeyError(f"Chain '{self.name}' is missing input variables: {missing}")
+        return {name: variables[name] for name in self.input_variables}
+
+
+def build_chain_registry(model=None) -> Dict[str, RegisteredChain]:
+    model = model if model is not None else llm
+    registry = {
+        name: RegisteredChain(name, compile_prompt(template, kind), model)
+        for name, (template, kind) in PROMPT_SPECS.items()
+    }
+    logger.info(f"Chain registry built with {len(registry)} chains ({PROMPT_ASSEMBLY_MODE} prompts)")
+    return registry
+
+
+# Built once when the app imports this module
+chain_registry = build_chain_registry()
+
+
+def get_chain(name: str) -> RegisteredChain:
+    try:
+        return chain_registry[name]
+    except KeyError:
+        raise KeyError(f"Unknown chain '{name}'")
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+REPORT_CONTEXT_TOKEN_BUDGET = int(os.getenv("REPORT_CONTEXT_TOKEN_BUDGET", "3000"))
+# Always keep at least this many of the newest messages verbatim
+CONTEXT_MIN_RECENT_MESSAGES = int(os.getenv("CONTEXT_MIN_RECENT_MESSAGES", "4"))
+# Share of the budget the summary of older turns may use
+CONTEXT_SUMMARY_SHARE = float(os.getenv("CONTEXT_SUMMARY_SHARE", "0.3"))
+# Rough chars-per-token ratio of llama-family tokenizers on English text
+CHARS_PER_TOKEN = 4
+SUMMARY_QUESTION_CHARS = 140
+SUMMARY_REPLY_CHARS = 80
+# The first user message (the chief complaint) is pinned into every summary
+CHIEF_COMPLAINT_CHARS = int(os.getenv("CONTEXT_CHIEF_COMPLAINT_CHARS", "300"))
+OPTION_PREFIXES = ("A.", "B.", "C.", "D.")
+# Room left for the "Summary of earlier conversation" / "Recent conversation" headings
+SECTION_HEADER_TOKENS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_message(msg: Dict[str, str]) -> str:
+    return f"{msg['role'].upper()}: {msg['content']}"
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _chosen_option(reply: str, question: Optional[Dict[str, str]]) -> Optional[str]:
+    """Text of the option a one-letter reply picked from the preceding assistant question"""
+    letter = reply.strip().strip("().").upper()
+    if len(letter) != 1 or f"{letter}." not in OPTION_PREFIXES or not question or question["role"] != "assistant":
+        return None
+    for line in question.get("content", "").splitlines():
+        line = line.strip()
+        if line.upper().startswith(f"{letter}."):
+            return line[2:].strip()
+    return None
+
+
+def summarize_message(msg: Dict[str, str], previous: Optional[Dict[str, str]] = None) -> str:
+    """One short line per message: assistant questions without their options, user replies clipped.
+
+    A one-letter answer is resolved against ``previous`` (the question it
+    answers), since the options themselves are dropped from the summary.
+    """
+    content = msg.get("content", "")
+    if msg["role"] == "assistant":
+        lines = [line for line in content.splitlines() if line.strip() and not line.strip().startswith(OPTION_PREFIXES)]
+        return f"ASSISTANT asked: {_clip(' '.join(lines), SUMMARY_QUESTION_CHARS)}"
+    if msg["role"] == "user":
+        chosen = _chosen_option(content, previous)
+        if chosen:
+            return f"USER chose: {_clip(chosen, SUMMARY_REPLY_CHARS)}"
+    return f"{msg['role'].upper()}: {_clip(content, SUMMARY_REPLY_CHARS)}"
+
+
+def summarize_messages(messages: List[Dict[str, str]], start: int = 0) -> List[str]:
+    """Summary lines for ``messages[start:]``, each user reply paired with the question before it"""
+    lines = []
+    for i in range(start, len(messages)):
+        previous = next((msg for msg in reversed(messages[:i]) if msg["role"] != "system"), None)
+        lines.append(summarize_message(messages[i], previous))
+    return lines
+
+
+def _fingerprint(messages: List[Dict[str, str]]) -> str:
+    if not messages:
+        return ""
+    last = messages[-1]
+    return hashlib.sha1(f"{len(messages)}|{last['role']}|{last.get('content', '')}".encode("utf-8")).hexdigest()
+
+
+class RollingSummary:
+    def __init__(self):
+        self.covered = 0
+        self.fingerprint = ""
+        self.lines: List[str] = []
+
+
+class RollingSummaryCache:
+    """Per-chat summaries of the turns that no longer fit in the prompt.
+
+    Non-system messages are append-only across turns, so a summary covering
+    the first N of them is extended with just the newly evicted messages. A
+    fingerprint of the N-th message detects edited histories, which are
+    summarized from scratch.
+    """
+
+    def __init__(self, max_sessions: int = None):
+        self.max_sessions = int(max_sessions if max_sessions is not None else os.getenv("CONTEXT_SUMMARY_MAX_SESSIONS", "5000"))
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self._stats = {"extended": 0, "reused": 0, "rebuilt": 0}
+
+    def summarize(self, chat_history_id: Optional[str], older: List[Dict[str, str]]) -> List[str]:
+        if not chat_history_id:
+            return summarize_messages(older)
+
+        summary = self._summaries.get(chat_history_id)
+        if summary is None or summary.covered > len(older) or summary.fingerprint != _fingerprint(older[:summary.covered]):
+            summary = RollingSummary()
+            self._stats["rebuilt"] += 1
+        elif summary.covered == len(older):
+            self._stats["reused"] += 1
+        else:
+            self._stats["extended"] += 1
+
+        summary.lines.extend(summarize_messages(older, summary.covered))
+        summary.covered = len(older)
+        summary.fingerprint = _fingerprint(older)
+
+        self._summaries[chat_history_id] = summary
+        self._summaries.move_to_end(chat_history_id)
+        while len(self._summaries) > self.max_sessions:
+            self._summaries.popitem(last=False)
+        return summary.lines
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._summaries), "max_sessions": self.max_sessions, **self._stats}
+
+
+summary_cache = RollingSummaryCache()
+
+
+def build_prompt_context(conversation_history: List[Dict[str, str]], chat_history_id: Optional[str] = None,
+                         token_budget: int = None, include_system: bool = False) -> str:
+    """Conversation text for a prompt, bounded to ``token_budget`` estimated tokens.
+
+    The newest turns are kept verbatim; whatever does not fit is replaced by a
+    rolling summary (cached per chat_history_id), so prompt size stays flat
+    as the conversation grows. The chief complaint (first user message) is
+    always kept. System messages (flow and question markers) are left out
+    unless ``include_system`` is set.
+    """
+    budget = token_budget or CONTEXT_TOKEN_BUDGET
+    messages = [msg for msg in conversation_history if include_system or msg["role"] != "system"]
+    formatted = [format_message(msg) for msg in messages]
+
+    total = sum(estimate_tokens(text) for text in formatted)
+    if total <= budget:
+        return "\n".join(formatted)
+
+    # Walk back from the newest message while the verbatim budget allows
+    recent_budget = budget - int(budget * CONTEXT_SUMMARY_SHARE)
+    used = 0
+    start = len(formatted)
+    while start > 0:
+        cost = estimate_tokens(formatted[start - 1])
+        if used + cost > recent_budget and len(formatted) - start >= CONTEXT_MIN_RECENT_MESSAGES:
+            break
+        used += cost
+        start -= 1
+
+    older = messages[:start]
+    lines = summary_cache.summarize(chat_history_id, older)
+    summary_budget = max(budget - used - SECTION_HEADER_TOKENS, 0)
+
+    # Pin the chief complaint if it was pushed out of the verbatim turns
+    pinned = None
+    complaint_index = next((i for i, msg in enumerate(older) if msg["role"] == "user"), None)
+    if complaint_index is not None:
+        pinned = f"Chief complaint: {_clip(older[complaint_index]['content'], CHIEF_COMPLAINT_CHARS)}"
+        summary_budget = max(summary_budget - estimate_tokens(pinned), 0)
+
+    # Keep the most recent summary lines that fit in the rest of the budget
+    kept: List[str] = []
+    for index in range(len(lines) - 1, -1, -1):
+        if index == complaint_index:
+            continue
+        cost = estimate_tokens(lines[index])
+        if summary_budget - cost < 0:
+            break
+        summary_budget -= cost
+        kept.append(lines[index])
+    kept.reverse()
+
+    omitted = len(lines) - len(kept) - (1 if pinned else 0)
+    header = "Summary of earlier conversation"
+    if omitted:
+        header += f" ({omitted} older messages omitted)"
+    parts = [f"{header}:"] + ([pinned] if pinned else []) + kept + ["Recent conversation:"] + formatted[start:]
+    return "\n".join(parts)
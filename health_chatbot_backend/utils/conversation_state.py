@@ -0,0 +1,160 @@
+import contextvars
+import json
+import re
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Same vocabularies the history scanners in agents/appointment_agent.py use
+CITIES = ["kanpur", "orai", "jhansi"]
+DEPARTMENTS = ["cardiology", "cardiologist", "pediatric", "pediatrician",
+               "orthopedic", "gynecologist", "dermatologist", "ent",
+               "neurologist", "psychiatrist", "dentist", "general physician"]
+DOCTOR_NAME_PATTERN = re.compile(r'dr\.?\s+([a-zA-Z\s]+)', re.IGNORECASE)
+# System marker written by the diagnosis flow right before the question it numbers
+QUESTION_MARKER = "diagnosis_question:"
+
+
+class ConversationState:
+    """Everything /chat derives from conversation_history, folded one message at a time.
+
+    The state remembers which history list it was built for and how many
+    messages it has seen, so it can be extended with just the new messages
+    of a turn instead of re-scanning the whole conversation.
+    """
+
+    def __init__(self):
+        self.flow: Optional[str] = None
+        self.question_count = 0
+        self.city: Optional[str] = None
+        self.department: Optional[str] = None
+        self.doctor_name: Optional[str] = None
+        self.selected_doctor_id: Optional[int] = None
+        self.selected_slot: Optional[dict] = None
+        self.length = 0
+        # Set by a question marker: the next assistant message is already counted
+        self._question_counted = False
+        self._history: Optional[List[Dict[str, str]]] = None
+
+    @classmethod
+    def from_history(cls, conversation_history: List[Dict[str, str]]) -> "ConversationState":
+        state = cls()
+        for msg in conversation_history:
+            state.apply(msg)
+        state._history = conversation_history
+        return state
+
+    def copy(self) -> "ConversationState":
+        clone = ConversationState()
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    def advance(self, conversation_history: List[Dict[str, str]], new_messages: List[Dict[str, str]]) -> "ConversationState":
+        """Copy of this state bound to ``conversation_history`` with ``new_messages`` folded in"""
+        state = self.copy()
+        for msg in new_messages:
+            state.apply(msg)
+        state._history = conversation_history
+        return state
+
+    def tracks(self, conversation_history: List[Dict[str, str]]) -> bool:
+        """True when this state is up to date for exactly this history list"""
+        return self._history is conversation_history and self.length == len(conversation_history)
+
+    def resync_length(self):
+        """Call after in-place edits that removed messages already folded in"""
+        if self._history is not None:
+            self.length = len(self._history)
+
+    def apply(self, msg: Dict[str, str]):
+        role = msg.get("role")
+        content = msg.get("content", "")
+        content_lower = content.lower()
+
+        if role == "system":
+            if "selected_flow" in content:
+                self.flow = content.split(":")[1].strip()
+            if "selected_doctor_id" in content:
+                try:
+                    self.selected_doctor_id = int(content.split(":")[1].strip())
+                except (ValueError, IndexError):
+                    pass
+            if "selected_slot:" in content:
+                try:
+                    self.selected_slot = json.loads(content.split("selected_slot:")[1].strip())
+                except ValueError:
+                    pass
+
+            if content.startswith(QUESTION_MARKER):
+                try:
+                    self.question_count = int(content[len(QUESTION_MARKER):].strip())
+                    self._question_counted = True
+                except ValueError:
+                    pass
+
+        # Multiple-choice questions carry A./B./C./D. options
+        if role == "assistant":
+            if self._question_counted:
+                self._question_counted = False
+            elif all(option in content_lower for option in ("a.", "b.", "c.", "d.")):
+                self.question_count += 1
+
+        for city in CITIES:
+            if city in content_lower:
+                self.city = city.title()
+                break
+        for dept in DEPARTMENTS:
+            if dept in content_lower:
+                self.department = dept
+                break
+        if "dr." in content_lower or "doctor" in content_lower:
+            name_match = DOCTOR_NAME_PATTERN.search(content_lower)
+            if name_match:
+                self.doctor_name = name_match.group(1).strip()
+
+        self.length += 1
+
+    def appointment_state(self) -> dict:
+        """Same shape as get_appointment_state()"""
+        state = {
+            "city": self.city,
+            "department": self.department,
+            "doctor_name": self.doctor_name,
+            "step": "start"
+        }
+        if not state["city"]:
+            state["step"] = "needs_city"
+        elif not state["department"] and not state["doctor_name"]:
+            state["step"] = "needs_preference"
+        else:
+            state["step"] = "ready_to_search"
+        return state
+
+
+# State of the conversation handled by the current /chat turn
+_turn_state: contextvars.ContextVar[Optional[ConversationState]] = contextvars.ContextVar("turn_state", default=None)
+
+
+@contextmanager
+def track_conversation(state: ConversationState):
+    """Make ``state`` the cached state for this turn's conversation_history"""
+    token = _turn_state.set(state)
+    try:
+        yield state
+    finally:
+        _turn_state.reset(token)
+
+
+def get_tracked_state(conversation_history: List[Dict[str, str]]) -> Optional[ConversationState]:
+    """The turn's cached state if it matches this history, else None (caller re-scans)"""
+    state = _turn_state.get()
+    if state is not None and state.tracks(conversation_history):
+        return state
+    return None
+
+
+def append_message(conversation_history: List[Dict[str, str]], msg: Dict[str, str]):
+    """Append to history and keep the turn's cached state in step"""
+    state = get_tracked_state(conversation_history)
+    conversation_history.append(msg)
+    if state is not None:
+        state.apply(msg)
@@ -1,11 +1,16 @@
 import logging
 from typing import List, Dict, Any
 
+from utils.conversation_state import ConversationState, get_tracked_state
+
 logger = logging.getLogger(__name__)
 
 def get_current_flow(conversation_history: List[Dict[str, str]]) -> str:
     print("Function: get_current_flow")
     """Extract current flow from conversation history"""
+    state = get_tracked_state(conversation_history)
+    if state is not None:
+        return state.flow
     # Get the most recent flow marker
     for msg in reversed(conversation_history):
         if msg["role"] == "system" and "selected_flow" in msg.get("content", ""):
@@ -15,14 +20,10 @@ def get_current_flow(conversation_history: List[Dict[str, str]]) -> str:
 def count_questions_asked(conversation_history: List[Dict[str, str]]) -> int:
     print("Function: count_questions_asked")
     """Count how many medical questions have been asked"""
-    question_count = 0
-    for msg in conversation_history:
-        if msg["role"] == "assistant":
-            content = msg.get("content", "").lower()
-            # Check if message contains multiple choice options (A., B., C., D.)
-            if "a." in content and "b." in content and "c." in content and "d." in content:
-                question_count += 1
-    return question_count
+    state = get_tracked_state(conversation_history)
+    if state is not None:
+        return state.question_count
+    return ConversationState.from_history(conversation_history).question_count
 
 def get_conversation_context(conversation_history: List[Dict[str, str]]) -> str:
     print("Function: get_conversation_context")
@@ -44,13 +45,30 @@ def get_conversation_context(conversation_history: List[Dict[str, str]]) -> str:
 def update_flow_marker(conversation_history: List[Dict[str, str]], new_flow: str):
     print("Function: update_flow_marker")
     """Update flow marker in conversation history"""
+    state = get_tracked_state(conversation_history)
     # Remove old flow markers
     conversation_history[:] = [
         msg for msg in conversation_history 
         if not (msg["role"] == "system" and "selected_flow" in msg.get("content", ""))
     ]
     # Add new flow marker
-    conversation_history.append({
+    marker = {
         "role": "system", 
         "content": f"selected_flow: {new_flow}"
-    })
+    }
+    conversation_history.append(marker)
+    if state is not None:
+        # Only older flow markers were removed, and the newest marker wins
+        state.apply(marker)
+        state.resync_length()
+
+def add_flow_marker_from_input(conversation_history: List[Dict[str, str]], user_input: str):
+    print("Function: add_flow_marker_from_input")
+    """Add the initial flow marker the web client used to add itself (server-side sessions)"""
+    if get_current_flow(conversation_history):
+        return
+    lower_input = user_input.strip().lower()
+    if "diagnosis" in lower_input:
+        update_flow_marker(conversation_history, "diagnosis")
+    elif "appointment" in lower_input:
+        update_flow_marker(conversation_history, "appointment")
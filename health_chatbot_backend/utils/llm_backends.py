@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+from ollama import ResponseError
+
+from config.settings import LLM_PROFILES, build_llm
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying on another Ollama instance: unreachable or timing out,
+# or answering with an HTTP error (overloaded, model not pulled, crashed runner)
+BACKEND_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError, httpx.HTTPStatusError, ResponseError)
+
+
+class NoLLMBackendError(ConnectionError):
+    """Raised when no configured Ollama backend could serve a request"""
+
+
+def is_model_missing_error(error: Exception) -> bool:
+    """Ollama answers 404 when the requested model is not pulled on that instance"""
+    return isinstance(error, ResponseError) and getattr(error, "status_code", None) == 404
+
+
+class LLMBackend:
+    """One Ollama instance and the ChatOllama client bound to it"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.model = build_llm(self.base_url)
+        self._clients: Dict[str, object] = {"default": self.model}
+        self.outstanding = 0
+        self.healthy = True
+        self.missing_models: Optional[List[str]] = None
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self._stats = {"requests": 0, "failures": 0}
+
+    def client_for(self, profile: str):
+        """ChatOllama client for ``profile`` on this backend, created on first use"""
+        client = self._clients.get(profile)
+        if client is None:
+            client = self._clients[profile] = build_llm(self.base_url, profile)
+        return client
+
+    @contextmanager
+    def track(self):
+        self.outstanding += 1
+        self._stats["requests"] += 1
+        try:
+            yield self
+        finally:
+            self.outstanding -= 1
+
+    def has_model(self, model: Optional[str]) -> bool:
+        """False only when the last health check (or a 404) showed ``model`` is not pulled here"""
+        return not model or not self.missing_models or model not in self.missing_models
+
+    def mark_model_missing(self, model: str, error: Exception):
+        # The instance is up; only this model is unavailable, so keep it in rotation
+        self._stats["failures"] += 1
+        self.missing_models = sorted(set(self.missing_models or []) | {model})
+        self.last_error = str(error) or type(error).__name__
+        logger.warning(f"LLM backend {self.base_url} does not have model {model}")
+
+    def mark_failed(self, error: Exception):
+        self._stats["failures"] += 1
+        self.healthy = False
+        self.last_error = str(error) or type(error).__name__
+        logger.warning(f"LLM backend {self.base_url} failed: {self.last_error}")
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "missing_models": self.missing_models,
+            "outstanding": self.outstanding,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+            **self._stats,
+        }
+
+
+def probe_backend(base_url: str, model_names: List[str], timeout: float) -> List[str]:
+    """GET /api/tags; returns which of ``model_names`` are not pulled. Raises if unreachable."""
+    with urllib.request.urlopen(f"{base_url}/api/tags", timeout=timeout) as response:
+        tags = json.loads(response.read() or b"{}")
+    available = set()
+    for entry in tags.get("models", []):
+        name = entry.get("name", "")
+        available.add(name)
+        if name.endswith(":latest"):
+            available.add(name.split(":")[0])
+    return [name for name in model_names if name not in available]
+
+
+class LLMBackendPool:
+    """Ollama instances balanced by least outstanding requests, with failover.
+
+    Backends come from OLLAMA_BACKENDS (comma-separated base URLs), falling
+    back to OLLAMA_BASE_URL or Ollama's default address. A backend that
+    fails a request is taken out of rotation until the periodic health check
+    (GET /api/tags) sees it answer again.
+    """
+
+    def __init__(self, base_urls: List[str] = None, health_check_interval: float = None, health_check_timeout: float = None):
+        if base_urls is None:
+            configured = os.getenv("OLLAMA_BACKENDS") or os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"
+            base_urls = [url.strip() for url in configured.split(",") if url.strip()]
+        if not base_urls:
+            raise ValueError("No Ollama backends configured (check OLLAMA_BACKENDS)")
+        self.backends = [LLMBackend(url) for url in base_urls]
+        self.health_check_interval = float(
+            health_check_interval if health_check_interval is not None
+            else os.getenv("LLM_HEALTH_CHECK_INTERVAL", "15")
+        )
+        self.health_check_timeout = float(
+            health_check_timeout if health_check_timeout is not None
+            else os.getenv("LLM_HEALTH_CHECK_TIMEOUT", "2")
+        )
+        # A chat keeps using "its" backend, whose KV cache holds the chat's prompt prefix,
+        # unless that backend has this many more requests outstanding than the least busy one
+        self.affinity_slack = int(os.getenv("LLM_AFFINITY_SLACK", "2"))
+        self._next = 0
+        self._checker: Optional[asyncio.Task] = None
+        self._failovers = 0
+        self._stats_affinity = {"hits": 0, "misses": 0}
+
+    def preferred_backend(self, affinity_key: str) -> LLMBackend:
+        """Rendezvous hash: stable per key, and only keys of a removed backend move"""
+        return max(
+            self.backends,
+            key=lambda backend: hashlib.sha1(f"{affinity_key}|{backend.base_url}".encode("utf-8")).digest()
+        )
+
+    def candidates(self, affinity_key: str = None, model: str = None) -> List[LLMBackend]:
+        """Healthy backends, least outstanding first; unhealthy ones last as a last resort.
+
+        With ``affinity_key`` (the chat id) the chat's preferred backend goes
+        first while it is healthy and not much busier than the others.
+        With ``model``, backends known not to have it pulled go after the
+        healthy ones that do.
+        """
+        count = len(self.backends)
+        # Rotate the starting point so ties are spread round-robin
+        start = self._next % count
+        self._next += 1
+        rotated = self.backends[start:] + self.backends[:start]
+        healthy = sorted((b for b in rotated if b.healthy and b.has_model(model)), key=lambda b: b.outstanding)
+        unhealthy = (
+            [b for b in rotated if b.healthy and not b.has_model(model)]
+            + [b for b in rotated if not b.healthy]
+        )
+        if affinity_key and len(healthy) > 1:
+            preferred = self.preferred_backend(affinity_key)
+            if preferred in healthy and preferred.outstanding <= healthy[0].outstanding + self.affinity_slack:
+                self._stats_affinity["hits"] += 1
+                healthy.remove(preferred)
+                healthy.insert(0, preferred)
+            else:
+                self._stats_affinity["misses"] += 1
+        return healthy + unhealthy
+
+    def model_missing_everywhere(self, model: str) -> bool:
+        """True once every backend is known not to have ``model`` pulled"""
+        return all(not backend.has_model(model) for backend in self.backends)
+
+    def record_failover(self):
+        self._failovers += 1
+
+    async def check_backend(self, backend: LLMBackend):
+        try:
+            model_names = sorted({profile["model"] for profile in LLM_PROFILES.values()})
+            backend.missing_models = await asyncio.to_thread(
+                probe_backend, backend.base_url, model_names, self.health_check_timeout
+            )
+            if not backend.healthy:
+                logger.info(f"LLM backend {backend.base_url} is healthy again")
+            backend.healthy = True
+            backend.last_error = None
+        except Exception as e:
+            backend.healthy = False
+            backend.last_error = str(e)
+        backend.last_checked = time.time()
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check_backend(backend) for backend in self.backends))
+
+    async def _check_periodically(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_check_interval)
+
+    def start(self):
+        """Start periodic health checks (idempotent)"""
+        if self._checker is None or self._checker.done():
+            self._checker = asyncio.create_task(self._check_periodically())
+
+    async def close(self):
+        if self._checker is not None:
+            self._checker.cancel()
+            await asyncio.gather(self._checker, return_exceptions=True)
+            self._checker = None
+
+    def stats(self) -> dict:
+        return {
+            "health_check_interval": self.health_check_interval,
+            "failovers": self._failovers,
+            "affinity": self._stats_affinity,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+
+# Shared instance
+llm_backends = LLMBackendPool()
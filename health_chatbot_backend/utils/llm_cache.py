@@ -0,0 +1,112 @@
+import json
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_text(value) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    text = " ".join(str(value).lower().split())
+    return re.sub(r"[\s.!?,;:]+$", "", text)
+
+
+def make_cache_key(template_name: str, inputs: dict, model_params: dict) -> str:
+    normalized = {name: normalize_text(value) for name, value in sorted(inputs.items())}
+    return json.dumps([template_name, normalized, model_params], sort_keys=True, ensure_ascii=False)
+
+
+class LLMResultCache:
+    """LRU + TTL cache of LLM completions keyed by template, inputs and model params"""
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        self.ttl = float(ttl if ttl is not None else os.getenv("LLM_CACHE_TTL", "3600"))
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._per_template: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, template_name: str, outcome: str):
+        self._stats[outcome] += 1
+        counters = self._per_template.setdefault(template_name, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, template_name: str, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self._count(template_name, "hits")
+                return value
+            del self._entries[key]
+            self._stats["expired"] += 1
+        self._count(template_name, "misses")
+        return None
+
+    def set(self, key: str, value: str):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "per_template": self._per_template,
+        }
+
+
+class VariantPool:
+    """Small pool of interchangeable completions per key (e.g. greetings per language).
+
+    Until ``size`` variants exist the caller generates a new one; after that a
+    random stored variant is served, so users still see some variety.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = int(size if size is not None else os.getenv("GREETING_POOL_SIZE", "3"))
+        self._variants: Dict[str, List[str]] = {}
+        self._stats = {"hits": 0, "misses": 0}
+
+    def count(self, key: str) -> int:
+        return len(self._variants.get(normalize_text(key), []))
+
+    def is_full(self, key: str) -> bool:
+        return self.count(key) >= self.size
+
+    def pick(self, key: str) -> Optional[str]:
+        variants = self._variants.get(normalize_text(key), [])
+        if len(variants) >= self.size:
+            self._stats["hits"] += 1
+            return random.choice(variants)
+        self._stats["misses"] += 1
+        return None
+
+    def add(self, key: str, value: str):
+        variants = self._variants.setdefault(normalize_text(key), [])
+        if value and value not in variants and len(variants) < self.size:
+            variants.append(value)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "keys": {key: len(variants) for key, variants in self._variants.items()},
+            **self._stats,
+        }
+
+
+# Shared instances
+llm_cache = LLMResultCache()
+greeting_pool = VariantPool()
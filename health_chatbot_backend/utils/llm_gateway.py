@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is served first
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# Chains that run outside a user's chat turn
+CHAIN_PRIORITIES = {
+    "report": "background",
+    "offline_report": "background",
+}
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call is rejected because the gateway queue is full or too slow"""
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """True if ``exc`` is, or was raised while handling, an LLMOverloadedError.
+
+    Agent functions wrap LLM errors in HTTPException(500); this lets the
+    outer handlers still answer 503 for rejected calls.
+    """
+    seen = 0
+    while exc is not None and seen < 10:
+        if isinstance(exc, LLMOverloadedError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+        seen += 1
+    return False
+
+
+class LLMGateway:
+    """Admission control in front of Ollama.
+
+    At most ``max_in_flight`` generations run at once. Further calls wait in
+    a priority queue (interactive chat before report generation); a call is
+    rejected immediately when its priority's queue is full and after
+    ``queue_timeout`` seconds of waiting, so clients get a fast 503 instead
+    of an opaque timeout.
+    """
+
+    def __init__(self, max_in_flight: int = None, max_queue: Dict[str, int] = None, queue_timeout: float = None):
+        self.max_in_flight = int(max_in_flight if max_in_flight is not None else os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+        self.max_queue = max_queue or {
+            "interactive": int(os.getenv("LLM_MAX_QUEUE_INTERACTIVE", "32")),
+            "background": int(os.getenv("LLM_MAX_QUEUE_BACKGROUND", "16")),
+        }
+        self.queue_timeout = float(queue_timeout if queue_timeout is not None else os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._stats = {
+            priority: {"calls": 0, "rejected": 0, "timeouts": 0, "total_wait_ms": 0.0, "total_generation_ms": 0.0}
+            for priority in PRIORITIES
+        }
+
+    async def _acquire(self, priority: str):
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            return
+        if self._queued[priority] >= self.max_queue[priority]:
+            self._stats[priority]["rejected"] += 1
+            raise LLMOverloadedError(f"LLM queue full for {priority} calls")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._sequence), waiter))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats[priority]["timeouts"] += 1
+                raise LLMOverloadedError(f"Waited {self.queue_timeout}s for an LLM slot")
+            raise
+        finally:
+            self._queued[priority] -= 1
+
+    def _release(self):
+        # Hand the slot straight to the best waiter so in_flight never dips below demand
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        """Hold one generation slot for the ``async with`` block"""
+        if priority not in PRIORITIES:
+            priority = "interactive"
+        stats = self._stats[priority]
+        queued_at = time.perf_counter()
+        await self._acquire(priority)
+        started = time.perf_counter()
+        stats["calls"] += 1
+        stats["total_wait_ms"] += (started - queued_at) * 1000
+        try:
+            yield
+        finally:
+            stats["total_generation_ms"] += (time.perf_counter() - started) * 1000
+            self._release()
+
+    def has_capacity(self) -> bool:
+        """True if a call made now would start without queueing"""
+        return self._in_flight < self.max_in_flight and not self._waiters
+
+    def stats(self) -> dict:
+        per_priority = {}
+        for priority, stats in self._stats.items():
+            calls = stats["calls"]
+            per_priority[priority] = {
+                "queued": self._queued[priority],
+                "max_queue": self.max_queue[priority],
+                "calls": calls,
+                "rejected": stats["rejected"],
+                "timeouts": stats["timeouts"],
+                "avg_wait_ms": round(stats["total_wait_ms"] / calls, 2) if calls else 0.0,
+                "avg_generation_ms": round(stats["total_generation_ms"] / calls, 2) if calls else 0.0,
+            }
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_timeout": self.queue_timeout,
+            "priorities": per_priority,
+        }
+
+
+def chain_priority(chain_name: str) -> str:
+    return CHAIN_PRIORITIES.get(chain_name, "interactive")
+
+
+# Shared instance
+llm_gateway = LLMGateway()
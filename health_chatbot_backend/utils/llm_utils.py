@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import json
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+# Import llm from settings
+from config.settings import LLM_PROFILES, get_profile_name
+from utils.chain_registry import get_chain
+from utils.llm_cache import llm_cache, make_cache_key
+from utils.llm_gateway import llm_gateway, chain_priority
+from utils.llm_backends import llm_backends, BACKEND_ERRORS, NoLLMBackendError, is_model_missing_error
+
+logger = logging.getLogger(__name__)
+
+# Queue receiving generated tokens while a streaming /chat turn is running
+_token_sink: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar("token_sink", default=None)
+
+
+# Chat the current LLM calls belong to; used to keep a chat on one Ollama backend
+_llm_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_session", default=None)
+
+
+@contextmanager
+def llm_session(chat_history_id: Optional[str]):
+    """Route LLM calls in this context to the chat's preferred backend"""
+    token = _llm_session.set(chat_history_id)
+    try:
+        yield
+    finally:
+        _llm_session.reset(token)
+
+
+@contextmanager
+def stream_tokens_to(queue: asyncio.Queue):
+    """Forward tokens of user-facing generations in this context to ``queue``"""
+    token = _token_sink.set(queue)
+    try:
+        yield
+    finally:
+        _token_sink.reset(token)
+
+
+class DeferredSink:
+    """Token sink for speculative generations: buffers tokens until the work is confirmed.
+
+    ``release(target)`` forwards what was buffered and everything after it to
+    ``target`` (or drops it if target is None); ``discard()`` drops it all.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._target: Optional[asyncio.Queue] = None
+        self._decided = False
+
+    async def put(self, text: str):
+        if not self._decided:
+            self._buffer.append(text)
+        elif self._target is not None:
+            await self._target.put(text)
+
+    def release(self, target: Optional[asyncio.Queue]):
+        self._decided = True
+        self._target = target
+        if target is not None:
+            for text in self._buffer:
+                target.put_nowait(text)
+        self._buffer = []
+
+    def discard(self):
+        self.release(None)
+
+
+def current_token_sink():
+    return _token_sink.get()
+
+
+# Profiles already reported as falling back to "default", so the warning is logged once
+_fallback_profiles = set()
+
+
+def resolve_profile(profile: str) -> str:
+    """``profile``, or "default" once no backend has the profile's model pulled"""
+    model = LLM_PROFILES[profile].get("model")
+    if profile == "default" or not model or not llm_backends.model_missing_everywhere(model):
+        return profile
+    if profile not in _fallback_profiles:
+        _fallback_profiles.add(profile)
+        logger.warning(f"No LLM backend has model {model} for profile '{profile}'; using the default profile")
+    return "default"
+
+
+def get_model_params(profile: str = "default") -> dict:
+    """Generation settings that change the completion, used in cache keys"""
+    params = LLM_PROFILES[profile]
+    return {
+        "model": params.get("model"),
+        "temperature": params.get("temperature"),
+        "max_tokens": params.get("num_predict", params.get("max_tokens")),
+        "stop": params.get("stop"),
+        "format": params.get("format"),
+    }
+
+
+async def emit_text(text: str):
+    """Send already-complete text (e.g. a cached reply) to the active token sink"""
+    sink = _token_sink.get()
+    if sink is not None and text:
+        await sink.put(text)
+
+
+async def run_chain(chain_name: str, stream: bool = False, cache: bool = False, priority: str = None, **variables) -> str:
+    """Run the registered chain ``chain_name`` and return the full completion text.
+
+    Only the chain's declared input variables are bound; the prompt itself was
+    compiled once in utils/chain_registry.py.
+
+    With ``stream=True`` and a token sink active (see ``stream_tokens_to``),
+    each chunk is pushed to the sink as soon as Ollama produces it; the
+    caller still receives the complete text for post-processing.
+
+    With ``cache=True`` the completion is cached under the chain name and the
+    normalized variables.
+
+    The LLM settings come from the chain's profile (config/settings.py
+    CHAIN_PROFILES), e.g. a small deterministic model for classification.
+
+    Generation waits for a slot in the LLM gateway; ``priority`` defaults to
+    the chain's class (reports are "background", everything else
+    "interactive"). Raises LLMOverloadedError when the gateway rejects the call.
+    """
+    chain = get_chain(chain_name)
+    inputs = chain.bind(variables)
+    profile = resolve_profile(get_profile_name(chain_name))
+
+    cache_key = None
+    if cache:
+        cache_key = make_cache_key(chain_name, inputs, get_model_params(profile))
+        cached = llm_cache.get(chain_name, cache_key)
+        if cached is not None:
+            if stream:
+                await emit_text(cached)
+            return cached
+
+    sink = _token_sink.get() if stream else None
+    async with llm_gateway.slot(priority or chain_priority(chain_name)):
+        try:
+            response = await _generate_with_failover(chain, inputs, sink, profile)
+        except NoLLMBackendError:
+            # The first calls only learn (from 404s) that the profile's model is missing
+            fallback = resolve_profile(profile)
+            if fallback == profile:
+                raise
+            profile = fallback
+            if cache_key is not None:
+                cache_key = make_cache_key(chain_name, inputs, get_model_params(profile))
+            response = await _generate_with_failover(chain, inputs, sink, profile)
+
+    if cache_key is not None:
+        llm_cache.set(cache_key, response)
+    return response
+
+
+async def _generate_with_failover(chain, inputs: dict, sink: Optional[asyncio.Queue], profile: str = "default") -> str:
+    """Generate on the least-loaded backend, moving on to the next one if it is unreachable"""
+    model = LLM_PROFILES[profile].get("model")
+    last_error = None
+    for backend in llm_backends.candidates(_llm_session.get(), model):
+        if last_error is not None:
+            llm_backends.record_failover()
+        runnable = chain.runnable_for(backend.client_for(profile))
+        emitted = False
+        with backend.track():
+            try:
+                if sink is not None:
+                    chunks = []
+                    async for chunk in runnable.astream(inputs):
+                        text = chunk.content
+                        if text:
+                            chunks.append(text)
+                            emitted = True
+                            await sink.put(text)
+                    return "".join(chunks)
+                message = await runnable.ainvoke(inputs)
+                return message.content
+            except BACKEND_ERRORS as e:
+                if is_model_missing_error(e):
+                    backend.mark_model_missing(model, e)
+                else:
+                    backend.mark_failed(e)
+                if emitted:
+                    # The client already saw part of this answer; don't splice in another one
+                    raise
+                last_error = e
+    raise NoLLMBackendError(f"No LLM backend could serve the request: {last_error}") from last_error
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"